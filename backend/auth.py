@@ -0,0 +1,89 @@
+import time
+from typing import Optional
+
+import jwt
+from jwt import PyJWKClient, PyJWKClientError
+
+
+class AuthenticatedUser:
+    """
+    Lightweight stand-in for the Supabase `User`, built from verified JWT claims.
+
+    Exposes the attributes the endpoints read (`id`, `email`, `role` and the metadata
+    dicts), so handlers don't care whether the user came from local verification or
+    from `supabase.auth.get_user`.
+    """
+
+    def __init__(self, claims: dict):
+        self.id = claims["sub"]
+        self.email = claims.get("email")
+        self.role = claims.get("role")
+        self.user_metadata = claims.get("user_metadata") or {}
+        self.app_metadata = claims.get("app_metadata") or {}
+        self.claims = claims
+
+
+class TokenVerifier:
+    """
+    Verifies Supabase access tokens locally instead of calling the Auth server.
+
+    HS256 tokens are checked against the project's JWT secret; asymmetric tokens
+    (RS256/ES256) against the project's JWKS, which is fetched once and cached. Expiry
+    and audience are always enforced.
+
+    `verify` returns the user on success, raises `jwt.InvalidTokenError` when the token
+    is definitely bad (expired, tampered, wrong audience), and returns None when it
+    cannot decide locally (no secret configured, unknown key id, JWKS unreachable) so
+    the caller can fall back to the remote check.
+
+    Parameters:
+        supabase_url (str, optional): Project URL; enables JWKS verification.
+        jwt_secret (str, optional): Project JWT secret; enables HS256 verification.
+        audience (str): Expected `aud` claim.
+        leeway (float): Clock skew tolerance in seconds for `exp`/`nbf`.
+    """
+
+    ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+    def __init__(self, supabase_url: Optional[str] = None, jwt_secret: Optional[str] = None,
+                 audience: str = "authenticated", leeway: float = 10.0):
+        self.jwt_secret = jwt_secret
+        self.audience = audience
+        self.leeway = leeway
+        self._jwks = None
+        if supabase_url:
+            self._jwks = PyJWKClient(f"{supabase_url.rstrip('/')}/auth/v1/.well-known/jwks.json",
+                                     cache_keys=True, lifespan=3600)
+
+    def _signing_key(self, token: str, algorithm: str):
+        if algorithm == "HS256":
+            return self.jwt_secret
+        if algorithm in self.ASYMMETRIC_ALGORITHMS and self._jwks is not None:
+            try:
+                # Blocking on the first call (and on unknown key ids); cached afterwards.
+                return self._jwks.get_signing_key_from_jwt(token).key
+            except PyJWKClientError:
+                return None
+        return None
+
+    def verify(self, token: str) -> Optional[AuthenticatedUser]:
+        algorithm = jwt.get_unverified_header(token).get("alg")
+        key = self._signing_key(token, algorithm)
+        if key is None:
+            return None
+        claims = jwt.decode(
+            token, key, algorithms=[algorithm], audience=self.audience, leeway=self.leeway,
+            options={"require": ["exp", "sub"]},
+        )
+        return AuthenticatedUser(claims)
+
+
+def token_cache_ttl(token: str, max_ttl: float) -> float:
+    """Seconds a verified token may stay cached: `max_ttl`, but never past its own `exp`."""
+    try:
+        exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except jwt.InvalidTokenError:
+        return 0.0
+    if exp is None:
+        return max_ttl
+    return max(0.0, min(max_ttl, exp - time.time()))
@@ -0,0 +1,159 @@
+import hashlib
+import os
+import re
+import tempfile
+from typing import Optional
+
+from cache import LRUCache
+
+_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp"}
+_CONTENT_TYPES = {extension: mime for mime, extension in _EXTENSIONS.items()}
+_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}\.(jpg|png|webp)$")
+
+
+def blob_key(data: bytes, content_type: str) -> str:
+    """Content address of a blob: sha256 of its bytes plus an extension for its type."""
+    return f"{hashlib.sha256(data).hexdigest()}.{_EXTENSIONS.get(content_type, 'jpg')}"
+
+
+def is_blob_key(key: str) -> bool:
+    return bool(_KEY_PATTERN.match(key))
+
+
+def content_type_for(key: str) -> str:
+    return _CONTENT_TYPES.get(key.rsplit(".", 1)[-1], "application/octet-stream")
+
+
+def sniff_content_type(data: bytes) -> str:
+    """Image type of raw upload bytes from their signature; anything unrecognized is treated as JPEG."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+class BlobStore:
+    """
+    Content-addressed image storage: identical bytes are stored once under their hash.
+
+    Blobs are referenced by the app path `{url_prefix}/{key}` rather than a storage URL,
+    so no image is reachable without a link the API has signed. Subclasses implement
+    `_exists`, `_put` and `read`. All methods block, so callers on the event loop should
+    dispatch them to a thread pool.
+    """
+
+    def __init__(self, url_prefix: str = "/blobs"):
+        self.url_prefix = url_prefix
+        # Keys known to be stored already, so repeat saves skip the existence check.
+        self._known = LRUCache(100_000, sizeof=lambda _: 1)
+
+    def save(self, data: bytes, content_type: str) -> str:
+        """Stores `data` unless an identical blob exists and returns its URL."""
+        key = blob_key(data, content_type)
+        if key not in self._known:
+            if not self._exists(key):
+                self._put(key, data, content_type)
+            self._known.set(key, True)
+        return self.url(key)
+
+    def url(self, key: str) -> str:
+        return f"{self.url_prefix}/{key}"
+
+    def key_from_url(self, url: str) -> Optional[str]:
+        """Blob key referenced by a stored URL, or None for anything else (e.g. older public URLs)."""
+        prefix = f"{self.url_prefix}/"
+        key = url[len(prefix):] if url.startswith(prefix) else None
+        return key if key is not None and is_blob_key(key) else None
+
+    def read(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    def _exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def _put(self, key: str, data: bytes, content_type: str):
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Filesystem backend for self-hosting and local development.
+
+    Blobs live under `directory/<first two hex chars>/<key>` and are served by the app.
+    """
+
+    def __init__(self, directory: str, url_prefix: str = "/blobs"):
+        super().__init__(url_prefix)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key: str) -> Optional[str]:
+        """Filesystem path of a blob, or None if `key` is not a valid blob key."""
+        if not is_blob_key(key):
+            return None
+        return os.path.join(self.directory, key[:2], key)
+
+    def read(self, key: str) -> bytes:
+        path = self.path_for(key)
+        if path is None:
+            raise FileNotFoundError(key)
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _exists(self, key: str) -> bool:
+        return os.path.exists(self.path_for(key))
+
+    def _put(self, key: str, data: bytes, content_type: str):
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so concurrent readers never see a partial file.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class SupabaseBlobStore(BlobStore):
+    """
+    Supabase Storage backend; blobs are kept under `prefix/` in a bucket that should be
+    private. The app hands out short-lived signed storage URLs via `signed_url`.
+    """
+
+    def __init__(self, client, bucket: str, prefix: str = "blobs", url_prefix: str = "/blobs"):
+        super().__init__(url_prefix)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _path(self, key: str) -> str:
+        return f"{self.prefix}/{key}"
+
+    def _exists(self, key: str) -> bool:
+        # Uploading without upsert fails on an existing object, so `_put` doubles as the
+        # existence check and costs one round trip instead of two.
+        return False
+
+    def _put(self, key: str, data: bytes, content_type: str):
+        try:
+            self.client.storage.from_(self.bucket).upload(
+                file=data, path=self._path(key),
+                file_options={"content-type": content_type, "cache-control": "31536000", "upsert": "false"},
+            )
+        except Exception as e:
+            message = str(e).lower()
+            if "duplicate" not in message and "already exists" not in message and "409" not in message:
+                raise
+
+    def read(self, key: str) -> bytes:
+        return self.client.storage.from_(self.bucket).download(self._path(key))
+
+    def signed_url(self, key: str, expires_in: int) -> str:
+        """Time-limited direct storage URL for one blob."""
+        result = self.client.storage.from_(self.bucket).create_signed_url(self._path(key), expires_in)
+        return result.get("signedURL") or result.get("signedUrl")
@@ -0,0 +1,310 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+
+def default_sizeof(value: Any) -> int:
+    """Approximates the memory footprint of a cached value in bytes."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value)
+    return len(json.dumps(value, default=str))
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache bounded by a byte budget, with per-entry TTL.
+
+    Parameters:
+        max_bytes (int): Total size budget; least recently used entries are evicted past it.
+        ttl_seconds (float, optional): Default lifetime of an entry. None means no expiry.
+        sizeof (Callable, optional): Function estimating an entry's size in bytes.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: Optional[float] = None, sizeof: Callable[[Any], int] = default_sizeof):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._sizeof = sizeof
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl_seconds: Optional[float] = None, size: Optional[int] = None):
+        size = self._sizeof(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+
+_MISSING = object()
+
+
+class DiskCache:
+    """
+    Directory-backed byte cache with TTL, shareable by every worker process on a host.
+
+    Entries are written to a temporary file and atomically renamed into place, so
+    concurrent readers never see partial data. Expiry is based on file mtime.
+
+    Parameters:
+        directory (str): Cache directory; created if missing.
+        ttl_seconds (float, optional): Lifetime of an entry. None means no expiry.
+        max_bytes (int, optional): When exceeded, the oldest files are pruned.
+    """
+
+    PRUNE_EVERY = 64
+
+    def __init__(self, directory: str, ttl_seconds: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    def _is_fresh(self, mtime: float) -> bool:
+        return self.ttl_seconds is None or time.time() - mtime < self.ttl_seconds
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.path_for(key)
+        try:
+            if not self._is_fresh(os.path.getmtime(path)):
+                self.delete(key)
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path_for(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._committed()
+
+    def fresh_path(self, key: str) -> Optional[str]:
+        """Path of a live entry (for streaming or range reads), or None on a miss."""
+        path = self.path_for(key)
+        try:
+            if self._is_fresh(os.path.getmtime(path)):
+                return path
+        except FileNotFoundError:
+            pass
+        return None
+
+    def open_writer(self, key: str) -> "DiskCacheWriter":
+        """Starts an incremental write; the entry only becomes visible on `commit()`."""
+        return DiskCacheWriter(self, key)
+
+    def _committed(self):
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.path_for(key))
+        except FileNotFoundError:
+            pass
+
+    def prune(self):
+        """Removes expired entries and, if over budget, the oldest ones."""
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or entry.name.startswith(".tmp-"):
+                continue
+            stat = entry.stat()
+            if not self._is_fresh(stat.st_mtime):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        if self.max_bytes is None:
+            return
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class DiskCacheWriter:
+    """Streams an entry into a DiskCache chunk by chunk, then atomically publishes it."""
+
+    def __init__(self, cache: DiskCache, key: str):
+        self._cache = cache
+        self._key = key
+        fd, self._tmp_path = tempfile.mkstemp(dir=cache.directory, prefix=".tmp-")
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes):
+        self._file.write(chunk)
+
+    def commit(self):
+        self._file.close()
+        os.replace(self._tmp_path, self._cache.path_for(self._key))
+        self._cache._committed()
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+class TieredCache:
+    """
+    In-process LRU in front of an optional shared DiskCache.
+
+    Values are stored as-is in memory and serialized with `encode`/`decode` on disk.
+    Disk hits are promoted into memory.
+    """
+
+    def __init__(self, memory: LRUCache, disk: Optional[DiskCache] = None,
+                 encode: Callable[[Any], bytes] = lambda v: json.dumps(v).encode("utf-8"),
+                 decode: Callable[[bytes], Any] = lambda b: json.loads(b)):
+        self.memory = memory
+        self.disk = disk
+        self._encode = encode
+        self._decode = decode
+
+    def get(self, key: str, default=None):
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.disk is not None:
+            data = self.disk.get(key)
+            if data is not None:
+                value = self._decode(data)
+                self.memory.set(key, value)
+                return value
+        return default
+
+    def set(self, key: str, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, self._encode(value))
+
+    def delete(self, key: str):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+
+class TaggedCache:
+    """
+    LRUCache whose entries carry tags, so a write can evict exactly the entries it affects.
+
+    Readers take `generation()` before querying the source and pass it to `set`; if any
+    invalidation happened in between, the possibly stale result is not cached.
+    """
+
+    def __init__(self, memory: LRUCache):
+        self.memory = memory
+        self._tags = {}  # tag -> set of keys
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key, default=None):
+        return self.memory.get(key, default)
+
+    def set(self, key, value, tags=(), generation: Optional[int] = None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self.memory.set(key, value)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            if sum(len(keys) for keys in self._tags.values()) > 4 * len(self.memory) + 1024:
+                self._prune_index()
+
+    def invalidate(self, *tags):
+        """Evicts every entry carrying any of `tags`."""
+        with self._lock:
+            self._generation += 1
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.pop(tag, set())
+            for key in keys:
+                self.memory.delete(key)
+
+    def _prune_index(self):
+        # Drop index entries for keys the LRU has already evicted or expired.
+        for tag in list(self._tags):
+            self._tags[tag] = {key for key in self._tags[tag] if key in self.memory}
+            if not self._tags[tag]:
+                del self._tags[tag]
+
+    def stats(self) -> dict:
+        return {**self.memory.stats(), "tags": len(self._tags)}
@@ -0,0 +1,34 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable
+
+
+class SupabaseIO:
+    """
+    Async facade over the synchronous supabase-py client.
+
+    Query builders are assembled on the event loop (no I/O happens there); only the
+    blocking network calls (`execute()`, storage uploads, auth requests) are dispatched to
+    a dedicated thread pool, so slow database round-trips never stall other requests and
+    never compete with the inference pool for threads.
+
+    Parameters:
+        max_workers (int): Number of threads available for concurrent Supabase calls.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max(1, int(max_workers))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="supabase-io")
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Runs a blocking Supabase call on the I/O pool and awaits its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, partial(fn, *args, **kwargs))
+
+    async def execute(self, query):
+        """Awaits `query.execute()` for a fully built table query."""
+        return await self.run(query.execute)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,180 @@
+from io import BytesIO
+from typing import Optional
+
+import numpy as np
+import cv2
+from PIL import Image
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+# OpenCV can decode JPEGs directly at 1/2, 1/4 or 1/8 scale via the DCT, which is far
+# cheaper than decoding at full size and resizing afterwards.
+_REDUCED_DECODE_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+
+
+class InvalidImageError(ValueError):
+    """Raised when uploaded bytes cannot be decoded as an image."""
+
+
+def choose_decode_scale(raw: bytes, min_size: tuple) -> int:
+    """
+    Picks the largest JPEG reduction factor that still leaves both edges at least `min_size`.
+
+    Only the file header is parsed. Non-JPEG or unreadable inputs return 1 (full decode).
+    """
+    try:
+        with Image.open(BytesIO(raw)) as header:
+            if header.format != "JPEG":
+                return 1
+            width, height = header.size
+    except Exception:
+        return 1
+    # EXIF rotation may swap the axes, so compare shortest edge to largest target edge.
+    shortest, needed = min(width, height), max(min_size)
+    for factor in sorted(_REDUCED_DECODE_FLAGS, reverse=True):
+        if shortest // factor >= needed:
+            return factor
+    return 1
+
+
+class ImageContext:
+    """
+    Decodes an upload once and lazily derives the views each analysis stage needs.
+
+    The full-resolution image is materialized a single time as a BGR uint8 array.
+    Grayscale (quality check), resized RGB (model input) and BGR (heatmap overlay)
+    views are computed on first access and cached, so every stage shares the same
+    NumPy buffers instead of decoding the upload again.
+
+    Parameters:
+        raw (bytes): The original upload, kept for stages that need the encoded file.
+        bgr (np.ndarray): Decoded image of shape (H, W, 3) in BGR order.
+        decode_scale (int): Reduction factor the image was decoded at (1 = full size).
+    """
+
+    def __init__(self, raw: bytes, bgr: np.ndarray, decode_scale: int = 1):
+        self.raw = raw
+        self.bgr = bgr
+        self.decode_scale = decode_scale
+        self._gray = None
+        self._detail_gray = None
+        self._resized_rgb = {}
+        self._downscaled = {}
+
+    @classmethod
+    def from_bytes(cls, raw: bytes, min_size: Optional[tuple] = None) -> "ImageContext":
+        """
+        Decodes encoded image bytes (JPEG, PNG, ...) into a new context.
+
+        When `min_size` (width, height) is given, JPEGs are decoded at the smallest
+        1/2, 1/4 or 1/8 scale that still covers it.
+        """
+        buffer = np.frombuffer(raw, np.uint8)
+        scale = choose_decode_scale(raw, min_size) if min_size else 1
+        bgr = cv2.imdecode(buffer, _REDUCED_DECODE_FLAGS[scale]) if scale > 1 else None
+        if bgr is None:
+            scale = 1
+            bgr = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+        if bgr is None:
+            raise InvalidImageError("Invalid image file.")
+        return cls(raw, bgr, decode_scale=scale)
+
+    @property
+    def gray(self) -> np.ndarray:
+        """Single-channel grayscale image, computed once."""
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    def detail_gray(self, edge: int) -> np.ndarray:
+        """
+        Returns a centered grayscale crop of at most `edge` x `edge` pixels at no less than half
+        the native resolution, for stats that depend on pixel scale such as sharpness.
+
+        The decoded image is reused when it is at most 2x reduced; otherwise the JPEG is decoded
+        once more at 1/2 scale straight to grayscale, which is still far cheaper than a full decode.
+        """
+        if self._detail_gray is None:
+            gray = None
+            if self.decode_scale > 2:
+                gray = cv2.imdecode(np.frombuffer(self.raw, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_2)
+            self._detail_gray = gray if gray is not None else self.gray
+        height, width = self._detail_gray.shape
+        top, left = max(0, (height - edge) // 2), max(0, (width - edge) // 2)
+        return self._detail_gray[top:top + edge, left:left + edge]
+
+    def downscaled(self, max_edge: int) -> np.ndarray:
+        """
+        Returns the BGR image shrunk so its longest edge is at most `max_edge`, cached per size.
+        Images already within the bound are returned as-is (no copy).
+        """
+        if max_edge not in self._downscaled:
+            height, width = self.bgr.shape[:2]
+            scale = max_edge / max(height, width)
+            if scale >= 1:
+                self._downscaled[max_edge] = self.bgr
+            else:
+                size = (max(1, round(width * scale)), max(1, round(height * scale)))
+                self._downscaled[max_edge] = cv2.resize(self.bgr, size, interpolation=cv2.INTER_AREA)
+        return self._downscaled[max_edge]
+
+    def resized_rgb(self, target_size: tuple) -> np.ndarray:
+        """
+        Returns the image resized to `target_size` (width, height) in RGB order, cached per size.
+
+        Resizing happens before the channel swap so only the small image is converted.
+        The returned array is shared; callers must not modify it in place.
+        """
+        if target_size not in self._resized_rgb:
+            resized = cv2.resize(self.bgr, target_size, interpolation=cv2.INTER_LANCZOS4)
+            self._resized_rgb[target_size] = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+        return self._resized_rgb[target_size]
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware that caps multipart upload bodies while they stream in.
+
+    Requests whose Content-Length already exceeds `max_bytes` are rejected before any
+    body is read; otherwise received bytes are counted chunk by chunk and the request
+    fails with 413 as soon as the cap is crossed, so nothing unbounded is buffered or
+    spooled to disk.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    def _too_large(self) -> HTTPException:
+        return HTTPException(status_code=413, detail=f"Upload exceeds the {self.max_bytes // (1024 * 1024)} MB limit.")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            return await self.app(scope, receive, send)
+
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            exc = self._too_large()
+            response = JSONResponse({"detail": exc.detail}, status_code=exc.status_code)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised inside form parsing, so FastAPI turns it into a normal 413 response.
+                    raise self._too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the inference executor cannot admit another request."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Inference queue is full.")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """
+    Dedicated thread pool for blocking image and TensorFlow work, with admission control.
+
+    Requests enter through `admit()`, which fails fast with `InferenceQueueFull` once
+    `max_pending` requests are already in flight, instead of letting work pile up.
+    Blocking calls are then dispatched with `run()`, which keeps the event loop free and
+    records how long each job sat in the pool queue before a worker picked it up.
+
+    Parameters:
+        max_workers (int): Number of worker threads.
+        max_pending (int): Maximum admitted requests (queued + running) at any time.
+        retry_after (int): Seconds suggested to rejected clients via Retry-After.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 16, retry_after: int = 2):
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+        self.retry_after = int(retry_after)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._queued = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_times = deque(maxlen=512)
+
+    @asynccontextmanager
+    async def admit(self):
+        """Reserves a request slot for the duration of the block, or raises InferenceQueueFull."""
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            raise InferenceQueueFull(self.retry_after)
+        self._pending += 1
+        try:
+            yield
+        finally:
+            self._pending -= 1
+
+    async def run(self, fn: Callable, *args):
+        """Runs a blocking callable on the pool and awaits its result."""
+        submitted_at = time.perf_counter()
+
+        def job():
+            with self._lock:
+                self._queued -= 1
+                self._wait_times.append(time.perf_counter() - submitted_at)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._completed += 1
+
+        with self._lock:
+            self._queued += 1
+        return await asyncio.wrap_future(self._pool.submit(job))
+
+    def stats(self) -> dict:
+        """Returns queue depth and wait-time figures for monitoring and autoscaling."""
+        with self._lock:
+            last_wait = self._wait_times[-1] if self._wait_times else 0.0
+            waits = sorted(self._wait_times)
+            queued, completed = self._queued, self._completed
+        wait_ms = {"last": 0.0, "avg": 0.0, "p95": 0.0, "max": 0.0}
+        if waits:
+            wait_ms = {
+                "last": round(last_wait * 1000, 2),
+                "avg": round(sum(waits) / len(waits) * 1000, 2),
+                "p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 2),
+                "max": round(waits[-1] * 1000, 2),
+            }
+        return {
+            "workers": self.max_workers,
+            "pending_requests": self._pending,
+            "max_pending": self.max_pending,
+            "queued_jobs": queued,
+            "completed_jobs": completed,
+            "rejected_requests": self._rejected,
+            "queue_wait_ms": wait_ms,
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent single-image requests for one model into a batched forward pass.
+
+    Callers `await submit(img)` with one preprocessed image (no batch axis). A background
+    worker waits for the first request, then keeps collecting until either `max_batch_size`
+    images are queued or `max_wait_ms` has elapsed, runs `run_batch` once on the stacked
+    batch and hands each caller back its own row of the result.
+
+    Parameters:
+        name (str): Label used in logs (e.g. "clinical").
+        run_batch (Callable): Blocking function mapping an (N, H, W, 3) array to N result rows.
+        max_batch_size (int): Upper bound on images per forward pass.
+        max_wait_ms (float): How long the first request in a batch may wait for company.
+        executor (InferenceExecutor, optional): Pool that runs the forward pass. Defaults to
+            the event loop's default thread pool.
+    """
+
+    def __init__(self, name: str, run_batch: Callable, max_batch_size: int = 8, max_wait_ms: float = 10.0,
+                 executor: Optional[InferenceExecutor] = None):
+        self.name = name
+        self._executor = executor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._run_batch = run_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def _ensure_worker(self):
+        # The queue and worker are bound to the running loop, so create them lazily.
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._serve())
+
+    async def submit(self, item: np.ndarray):
+        """Queues one image and returns its row of the batched output."""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[np.ndarray, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # Callers that gave up (client disconnect, timeout) shouldn't cost a batch slot.
+        return [(item, future) for item, future in batch if not future.cancelled()]
+
+    async def _execute(self, batch_array: np.ndarray):
+        if self._executor is not None:
+            return await self._executor.run(self._run_batch, batch_array)
+        return await asyncio.to_thread(self._run_batch, batch_array)
+
+    async def _serve(self):
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+            try:
+                results = await self._execute(np.stack([item for item, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), row in zip(batch, results):
+                if not future.done():
+                    future.set_result(row)
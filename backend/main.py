@@ -10,14 +10,16 @@
 import os
 import traceback
 import base64
-from io import BytesIO
 import json
 import uuid
 import re
+import hashlib
+import hmac
+import time
+from urllib.parse import urlencode
+import asyncio
 
 import numpy as np
-import cv2
-from PIL import Image
 from dotenv import load_dotenv
 from typing import Optional, List
 
@@ -26,18 +28,28 @@ from keras.models import load_model
 from keras.applications.efficientnet import preprocess_input as preprocess_b3
 from keras.applications.efficientnet_v2 import preprocess_input as preprocess_b4
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Depends, Security
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Depends, Security, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import elevenlabs
 from elevenlabs.client import ElevenLabs
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response, FileResponse, RedirectResponse
 import httpx
+import jwt
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
 
 # --- Import your custom XAI functions ---
-from x_ai import generate_gradcam, apply_heatmap_overlay
+from x_ai import build_gradcam_model, make_gradcam_predictor, warmup_predictor, apply_heatmap_overlay, encode_image, encode_cam, decode_cam
+from inference import MicroBatcher, InferenceExecutor, InferenceQueueFull
+from image_ingest import ImageContext, InvalidImageError, UploadSizeLimitMiddleware
+from cache import LRUCache, DiskCache, TieredCache, TaggedCache
+from quality_gate import QualityThresholds, DEFAULT_THRESHOLDS, assess_quality
+from db import SupabaseIO
+from auth import TokenVerifier, token_cache_ttl
+from blob_store import LocalBlobStore, SupabaseBlobStore, content_type_for, is_blob_key, sniff_content_type
+from renditions import build_renditions
+from tts_cache import TTSAudioCache, etag_for, etag_matches
 
 # --- Import and configure GenAI, Supabase, etc. ---
 import google.generativeai as genai
@@ -79,6 +91,121 @@ if TAVUS_API_KEY and TAVUS_REPLICA_ID:
 else:
     print("⚠️ Tavus credentials not found. Video generation will be mocked.")
 
+# --- Inference Micro-Batching ---
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "8"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "10"))
+
+# --- Compiled Inference Graphs ---
+INFERENCE_COMPILE = os.getenv("INFERENCE_COMPILE", "true").lower() == "true"
+INFERENCE_XLA = os.getenv("INFERENCE_XLA", "false").lower() == "true"
+# Grad-CAMs computed per scan. Every scan in a batch pays for all k, so only raise this when
+# clients actually request cam_classes > 1; requests are capped at this value.
+GRADCAM_TOP_K = int(os.getenv("GRADCAM_TOP_K", "1"))
+
+# --- Inference Executor (keeps TensorFlow/OpenCV work off the event loop) ---
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+INFERENCE_MAX_PENDING = int(os.getenv("INFERENCE_MAX_PENDING", "16"))
+INFERENCE_RETRY_AFTER_S = int(os.getenv("INFERENCE_RETRY_AFTER_S", "2"))
+
+# --- Upload Limits ---
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "15")) * 1024 * 1024)
+
+# --- Analysis Result Cache ---
+MODEL_VERSION = os.getenv("MODEL_VERSION", "b3-clinical_b4-consumer_v1")
+ANALYSIS_CACHE_MAX_BYTES = int(float(os.getenv("ANALYSIS_CACHE_MAX_MB", "64")) * 1024 * 1024)
+ANALYSIS_CACHE_TTL_S = float(os.getenv("ANALYSIS_CACHE_TTL_S", "3600"))
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR")  # Optional shared on-disk tier for all workers
+
+# --- Deferred Heatmap Handles ---
+HEATMAP_HANDLE_TTL_S = float(os.getenv("HEATMAP_HANDLE_TTL_S", "600"))
+HEATMAP_STORE_MAX_BYTES = int(float(os.getenv("HEATMAP_STORE_MAX_MB", "128")) * 1024 * 1024)
+
+# --- Heatmap Rendering ---
+HEATMAP_MAX_EDGE = int(os.getenv("HEATMAP_MAX_EDGE", "1024"))
+HEATMAP_FORMAT = os.getenv("HEATMAP_FORMAT", "jpeg").lower()  # "jpeg" or "webp"
+if HEATMAP_FORMAT not in ("jpeg", "webp"):
+    raise ValueError(f"Unsupported HEATMAP_FORMAT {HEATMAP_FORMAT!r}; use 'jpeg' or 'webp'.")
+HEATMAP_QUALITY = int(os.getenv("HEATMAP_QUALITY", "85"))
+HEATMAP_MIME = "image/webp" if HEATMAP_FORMAT == "webp" else "image/jpeg"
+CASE_HEATMAP_CACHE_MAX_BYTES = int(float(os.getenv("CASE_HEATMAP_CACHE_MAX_MB", "64")) * 1024 * 1024)
+
+# --- Supabase I/O ---
+SUPABASE_IO_WORKERS = int(os.getenv("SUPABASE_IO_WORKERS", "8"))
+
+# --- Auth ---
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")  # Enables local HS256 verification; JWKS is used otherwise
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+AUTH_TOKEN_CACHE_TTL_S = float(os.getenv("AUTH_TOKEN_CACHE_TTL_S", "300"))
+AUTH_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_TOKEN_CACHE_MAX_ENTRIES", "10000"))
+
+# --- Blob Storage ---
+# Content-addressed image storage: "supabase" (private bucket) or "local" (filesystem). Either way
+# images are served through /blobs/{key} with a signature, never from a public URL.
+BLOB_BACKEND = os.getenv("BLOB_BACKEND", "supabase").lower()
+BLOB_BUCKET = os.getenv("BLOB_BUCKET", "case-images")
+# Required for the local backend. Point it at a persistent volume: the container filesystem
+# on Cloud Run is memory-backed and lost whenever an instance is recycled.
+BLOB_DIR = os.getenv("BLOB_DIR")
+if BLOB_BACKEND not in ("supabase", "local"):
+    raise ValueError(f"Unsupported BLOB_BACKEND {BLOB_BACKEND!r}; use 'supabase' or 'local'.")
+if BLOB_BACKEND == "local" and not BLOB_DIR:
+    raise ValueError("BLOB_DIR must be set when BLOB_BACKEND is 'local'.")
+BLOB_SIGNED_URL_TTL_S = int(os.getenv("BLOB_SIGNED_URL_TTL_S", "3600"))  # Lifetime of Supabase storage redirects
+
+# --- Text-to-Speech ---
+TTS_VOICE_ID = os.getenv("TTS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")  # "Rachel" - a standard, high-quality voice
+TTS_MODEL_ID = os.getenv("TTS_MODEL_ID", "eleven_multilingual_v2")
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "4"))
+# Opt-in: synthesize consumer explanations in the background before the user presses play
+TTS_PREFETCH = os.getenv("TTS_PREFETCH", "false").lower() in ("1", "true", "yes")
+TTS_PREFETCH_MAX_CONCURRENT = int(os.getenv("TTS_PREFETCH_MAX_CONCURRENT", "1"))
+# Finished prefetches are held in memory for a while, so prefetch works without TTS_CACHE_DIR
+TTS_PREFETCH_STORE_MAX_BYTES = int(float(os.getenv("TTS_PREFETCH_STORE_MAX_MB", "16")) * 1024 * 1024)
+TTS_PREFETCH_STORE_TTL_S = float(os.getenv("TTS_PREFETCH_STORE_TTL_S", "900"))
+# Optional persistent audio cache. Leave unset unless it points at a persistent volume (see BLOB_DIR).
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR")
+TTS_CACHE_TTL_S = float(os.getenv("TTS_CACHE_TTL_S", str(30 * 24 * 3600)))
+TTS_CACHE_MAX_BYTES = int(float(os.getenv("TTS_CACHE_MAX_MB", "512")) * 1024 * 1024)
+if TTS_PREFETCH and not TTS_CACHE_DIR and TTS_PREFETCH_STORE_MAX_BYTES <= 0:
+    raise ValueError("TTS_PREFETCH needs somewhere to keep audio: set TTS_CACHE_DIR or TTS_PREFETCH_STORE_MAX_MB > 0.")
+
+# --- List Renditions ---
+RENDITION_QUALITY = int(os.getenv("RENDITION_QUALITY", "80"))
+
+# --- Render Executor (renditions and on-demand heatmaps, kept apart from analyze requests) ---
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "1"))
+RENDER_MAX_PENDING = int(os.getenv("RENDER_MAX_PENDING", "8"))
+
+# --- Lesion Comparison Store ---
+COMPARISON_MODEL = os.getenv("COMPARISON_MODEL", "gemini-2.0-flash")
+COMPARISON_PROMPT_VERSION = "v1"  # Bump when the prompt in get_comparison_explanation changes
+COMPARISON_CACHE_MAX_BYTES = int(float(os.getenv("COMPARISON_CACHE_MAX_MB", "16")) * 1024 * 1024)
+COMPARISON_CACHE_TTL_S = float(os.getenv("COMPARISON_CACHE_TTL_S", str(7 * 24 * 3600)))
+COMPARISON_CACHE_DIR = os.getenv("COMPARISON_CACHE_DIR")  # Optional shared on-disk tier for all workers
+
+# --- Outbound HTTP ---
+HTTP_CLIENT_MAX_CONNECTIONS = int(os.getenv("HTTP_CLIENT_MAX_CONNECTIONS", "100"))
+HTTP_CLIENT_MAX_KEEPALIVE = int(os.getenv("HTTP_CLIENT_MAX_KEEPALIVE", "20"))
+HTTP_CLIENT_KEEPALIVE_EXPIRY_S = float(os.getenv("HTTP_CLIENT_KEEPALIVE_EXPIRY_S", "30"))
+HTTP_CLIENT_CONNECT_TIMEOUT_S = float(os.getenv("HTTP_CLIENT_CONNECT_TIMEOUT_S", "5"))
+HTTP_CLIENT_READ_TIMEOUT_S = float(os.getenv("HTTP_CLIENT_READ_TIMEOUT_S", "20"))
+
+# --- Case Listing Cache ---
+CASE_CACHE_TTL_S = float(os.getenv("CASE_CACHE_TTL_S", "30"))
+CASE_CACHE_MAX_BYTES = int(float(os.getenv("CASE_CACHE_MAX_MB", "16")) * 1024 * 1024)
+
+# --- List Pagination ---
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "50"))
+LIST_PAGE_MAX = int(os.getenv("LIST_PAGE_MAX", "200"))
+
+# --- Image Quality Gate ---
+# Per-mode limits; override any field with QUALITY_<MODE>_<FIELD>, e.g. QUALITY_CONSUMER_MIN_SHARPNESS=40
+QUALITY_THRESHOLDS = {mode: QualityThresholds.from_env(mode, defaults) for mode, defaults in DEFAULT_THRESHOLDS.items()}
+
+# --- Public URLs ---
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL")  # e.g. https://api.example.com; defaults to the request's base URL
+URL_SIGNING_SECRET = (os.getenv("URL_SIGNING_SECRET") or SUPABASE_KEY or uuid.uuid4().hex).encode("utf-8")
+
 # ==============================================================================
 # 2. Pydantic Models for Data Validation
 # ==============================================================================
@@ -92,7 +219,8 @@ class VideoRequest(BaseModel):
 # FIX: Add an 'is_private' flag to differentiate tracking scans from clinical cases.
 class SubmitCaseRequest(BaseModel):
     image_base64: str
-    heatmap_image_base64: str
+    heatmap_image_base64: Optional[str] = None
+    heatmap_cam: Optional[dict] = None # Compact raw Grad-CAM (see x_ai.encode_cam); preferred over a rendered heatmap
     predictions: List[dict]
     risk_level: str
     ai_explanation: str
@@ -126,7 +254,70 @@ app = FastAPI(title="DermaSense AI Backend")
 
 models = {}
 class_labels = {}
+batchers = {}
+readiness = {"models_ready": False}
+MODEL_INPUT_SIZES = {"clinical": (300, 300), "consumer": (380, 380)}
+# Column projections for list views; full rows come from the per-case detail endpoints.
+CASE_LIST_COLUMNS = "id, submitted_at, status, risk_level, predictions, notes, image_url, heatmap_image_url, heatmap_cam, renditions, patient_id, lesion_id, profiles:patient_id(full_name)"
+HISTORY_LIST_COLUMNS = "id, lesion_id, image_url, predictions, risk_level, submitted_at, heatmap_image_url, heatmap_cam, renditions"
+REVIEW_LIST_COLUMNS = "id, image_url, predictions, submitted_at, status, notes, renditions"
 security = HTTPBearer()
+inference_executor = InferenceExecutor(
+    max_workers=INFERENCE_WORKERS,
+    max_pending=INFERENCE_MAX_PENDING,
+    retry_after=INFERENCE_RETRY_AFTER_S,
+)
+# Bounded pool for overlay and rendition rendering, so stored-case and deferred renders never
+# take inference workers or admission slots from /api/v2/analyze.
+render_executor = InferenceExecutor(
+    max_workers=RENDER_WORKERS,
+    max_pending=RENDER_MAX_PENDING,
+    retry_after=INFERENCE_RETRY_AFTER_S,
+)
+blob_store = LocalBlobStore(BLOB_DIR) if BLOB_BACKEND == "local" else SupabaseBlobStore(supabase, BLOB_BUCKET)
+# blob key -> signed storage URL, reused for half its lifetime
+blob_redirect_cache = LRUCache(10_000, ttl_seconds=BLOB_SIGNED_URL_TTL_S / 2, sizeof=lambda _: 1)
+# Synthesized speech, keyed by (text hash, voice, model) and kept on disk when TTS_CACHE_DIR is
+# set; misses are synthesized off the event loop
+tts_cache = TTSAudioCache(
+    DiskCache(TTS_CACHE_DIR, ttl_seconds=TTS_CACHE_TTL_S, max_bytes=TTS_CACHE_MAX_BYTES) if TTS_CACHE_DIR else None,
+    memory=LRUCache(TTS_PREFETCH_STORE_MAX_BYTES, ttl_seconds=TTS_PREFETCH_STORE_TTL_S) if TTS_PREFETCH_STORE_MAX_BYTES > 0 else None,
+    max_workers=TTS_WORKERS,
+    max_prefetch=TTS_PREFETCH_MAX_CONCURRENT,
+)
+# App-lifetime pooled client for every outbound fetch; opened on startup, closed on shutdown.
+http_client: Optional[httpx.AsyncClient] = None
+# Blocking supabase-py calls run here, off the event loop and apart from inference work.
+supabase_io = SupabaseIO(max_workers=SUPABASE_IO_WORKERS)
+token_verifier = TokenVerifier(SUPABASE_URL, SUPABASE_JWT_SECRET, audience=SUPABASE_JWT_AUDIENCE)
+# sha256(token) -> user; entries never outlive the token's own expiry
+token_cache = LRUCache(AUTH_TOKEN_CACHE_MAX_ENTRIES, sizeof=lambda _: 1)
+analysis_cache = TieredCache(
+    LRUCache(ANALYSIS_CACHE_MAX_BYTES, ttl_seconds=ANALYSIS_CACHE_TTL_S),
+    DiskCache(ANALYSIS_CACHE_DIR, ttl_seconds=ANALYSIS_CACHE_TTL_S, max_bytes=ANALYSIS_CACHE_MAX_BYTES * 8) if ANALYSIS_CACHE_DIR else None,
+)
+# Case-list pages, case details and lesion scan lists, tagged so writes evict only what they touch:
+#   case:{id}          every page/detail containing that case
+#   cases:head         first pages of the dashboard list (where new cases appear)
+#   cases:status:{s}   dashboard pages filtered by status s
+#   lesion:{id}        the scan list of a lesion
+case_cache = TaggedCache(LRUCache(CASE_CACHE_MAX_BYTES, ttl_seconds=CASE_CACHE_TTL_S))
+# Temporal comparisons keyed by the ordered (previous, latest) case pair plus prompt/model version
+comparison_cache = TieredCache(
+    LRUCache(COMPARISON_CACHE_MAX_BYTES, ttl_seconds=COMPARISON_CACHE_TTL_S),
+    DiskCache(COMPARISON_CACHE_DIR, ttl_seconds=COMPARISON_CACHE_TTL_S) if COMPARISON_CACHE_DIR else None,
+)
+# comparison key -> in-flight task, so concurrent views and the background refresh share one Gemini call
+comparison_tasks = {}
+# Strong references to fire-and-forget tasks so they aren't garbage-collected mid-flight
+background_tasks = set()
+# (case_id, max_edge) -> rendered overlay bytes for stored raw CAMs
+case_heatmap_cache = LRUCache(CASE_HEATMAP_CACHE_MAX_BYTES, ttl_seconds=3600)
+# deferred heatmap signature -> rendered overlay bytes (a per-worker cache; handles themselves are stateless)
+heatmap_store = LRUCache(HEATMAP_STORE_MAX_BYTES, ttl_seconds=HEATMAP_HANDLE_TTL_S)
+
+# --- Upload Size Limit (registered first so CORS headers wrap its 413s) ---
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES)
 
 # --- CORS Middleware ---
 app.add_middleware(
@@ -135,6 +326,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Content-Location", "ETag"],
 )
 
 # ==============================================================================
@@ -148,21 +340,22 @@ def find_last_conv_layer(model):
             return layer.name
     raise ValueError("Could not automatically find a convolutional layer in the model.")
 
-def check_image_quality(image_bytes: bytes, blur_threshold: float = 50.0):
-    """Performs a basic check for blurriness to prevent 'garbage in, garbage out'."""
-    nparr = np.frombuffer(image_bytes, np.uint8)
-    img_cv = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    if img_cv is None:
+def decode_image(image_bytes: bytes, min_size: Optional[tuple] = None) -> ImageContext:
+    """
+    Decodes an upload once into a shared ImageContext, rejecting unreadable files.
+    Oversized JPEGs are decoded at reduced scale, never below `min_size`.
+    """
+    try:
+        return ImageContext.from_bytes(image_bytes, min_size=min_size)
+    except InvalidImageError:
         raise HTTPException(status_code=400, detail="Invalid image file.")
-    gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
-    laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-    if laplacian_var < blur_threshold:
-        return {"is_clear": False, "message": f"Image may be too blurry (Score: {laplacian_var:.2f}). Please retake with better focus."}
-    return {"is_clear": True}
 
-def process_image(contents: bytes, target_size: tuple):
-    """Reads image bytes, converts to RGB, and resizes."""
-    return Image.open(BytesIO(contents)).convert("RGB").resize(target_size, Image.LANCZOS)
+def check_image_quality(image: ImageContext, mode: str):
+    """
+    Rejects blurry, badly exposed or glare-heavy images before inference to prevent
+    'garbage in, garbage out'. Stats are computed on a downsampled frame.
+    """
+    return assess_quality(image, QUALITY_THRESHOLDS[mode])
 
 def classify_risk(label: str) -> str:
     """Assigns a risk level based on the predicted label."""
@@ -171,22 +364,140 @@ def classify_risk(label: str) -> str:
     if "basal cell carcinoma" in label or "actinic keratosis" in label: return "medium"
     return "low"
 
+def make_batch_predictor(predictor):
+    """
+    Returns a blocking function that runs one taped forward pass over a stacked batch,
+    yielding a (predictions, heatmaps) pair per image, with one heatmap per top-k class.
+    """
+    def run_batch(batch: np.ndarray) -> list:
+        predictions, heatmaps = predictor(batch)
+        return list(zip(predictions, heatmaps))
+    return run_batch
+
+def parse_data_uri(value: str, default_mime: str = "image/jpeg"):
+    """Splits a base64 data URI (or bare base64 string) into (mime type, decoded bytes)."""
+    header, _, data = value.rpartition(",")
+    mime_type = header[5:].split(";")[0] if header.startswith("data:") else default_mime
+    return mime_type or default_mime, base64.b64decode(data)
+
+def public_url(request: Request, path: str) -> str:
+    """Builds an absolute URL for a backend path, honoring PUBLIC_BASE_URL behind proxies."""
+    base = PUBLIC_BASE_URL or str(request.base_url)
+    return f"{base.rstrip('/')}{path}"
+
+def sign_path(path: str) -> str:
+    """HMAC signature that lets a URL be embedded in <img> tags without a bearer token."""
+    return hmac.new(URL_SIGNING_SECRET, path.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+def signed_url(request: Request, path: str) -> str:
+    """Absolute URL for a backend path, carrying its signature."""
+    return f"{public_url(request, path)}?sig={sign_path(path)}"
+
+def keyset_page(query, limit: int, cursor: Optional[int]):
+    """Pages a query newest-first by `id`, fetching one extra row to detect whether more remain."""
+    if cursor is not None:
+        query = query.lt("id", cursor)
+    return query.order("id", desc=True).limit(limit + 1)
+
+def finish_page(rows: list, limit: int, response: Response) -> list:
+    """Drops the look-ahead row and, if there is a next page, sets its cursor in X-Next-Cursor."""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1]["id"])
+    return rows
+
+def attach_media_urls(rows: list, request: Request) -> list:
+    """
+    Expands stored blob paths to absolute, signed URLs and points rows that only store a
+    raw CAM at the on-demand heatmap renderer.
+    """
+    for row in rows:
+        for column in ("image_url", "heatmap_image_url"):
+            if isinstance(row.get(column), str) and row[column].startswith("/"):
+                row[column] = signed_url(request, row[column])
+        if row.get("renditions"):
+            # Rebuilt rather than updated in place: callers copy rows shallowly, so the nested
+            # dicts may still belong to case_cache.
+            row["renditions"] = {
+                kind: {name: signed_url(request, url) if url.startswith("/") else url for name, url in sizes.items()}
+                for kind, sizes in row["renditions"].items()
+            }
+        if row.get("heatmap_cam") and not row.get("heatmap_image_url") and row.get("id") is not None:
+            row["heatmap_image_url"] = signed_url(request, f"/api/cases/{row['id']}/heatmap")
+    return rows
+
+async def store_blob(data: bytes, content_type: str) -> str:
+    """Stores an image in the blob store (deduplicated by content hash) and returns its URL."""
+    return await supabase_io.run(blob_store.save, data, content_type)
+
+async def store_renditions(image_bytes: bytes, heatmap_cam: Optional[dict] = None, heatmap_bytes: Optional[bytes] = None) -> Optional[dict]:
+    """
+    Generates the small/medium WebP list renditions on the render executor and stores them
+    as blobs. Returns {"image": {"small": url, "medium": url}, "heatmap": {...}}, or None if
+    generation fails or the render queue is full (listings then fall back to the originals).
+    """
+    try:
+        async with render_executor.admit():
+            renditions = await render_executor.run(build_renditions, image_bytes, heatmap_cam, heatmap_bytes, RENDITION_QUALITY)
+        names = [(kind, size) for kind, sizes in renditions.items() for size in sizes]
+        urls = await asyncio.gather(*(store_blob(renditions[kind][size], "image/webp") for kind, size in names))
+    except Exception:
+        print(traceback.format_exc())
+        return None
+    stored = {}
+    for (kind, size), url in zip(names, urls):
+        stored.setdefault(kind, {})[size] = url
+    return stored
+
+async def load_image_bytes(image_ref: str) -> bytes:
+    """Loads a stored case image from the blob store, its public URL (older rows), or an inline base64 value (older history rows)."""
+    key = blob_store.key_from_url(image_ref)
+    if key is not None:
+        return await supabase_io.run(blob_store.read, key)
+    if image_ref.startswith(("http://", "https://")):
+        response = await http_client.get(image_ref)
+        response.raise_for_status()
+        return response.content
+    return parse_data_uri(image_ref)[1]
+
 def clean_json_response(text: str) -> str:
     """Strips markdown fences from a string to ensure valid JSON."""
     return text.strip().replace("```json", "").replace("```", "")
 
-def get_current_user(token: HTTPAuthorizationCredentials = Security(security)):
-    """Dependency to validate JWT and get user from Supabase."""
+async def get_current_user(token: HTTPAuthorizationCredentials = Security(security)):
+    """
+    Dependency to validate JWT and get the user.
+
+    Tokens are verified locally (signature, expiry, audience) and cached by hash, so
+    repeat calls skip the Supabase Auth round trip. Only tokens that can't be judged
+    locally (no secret configured, unknown signing key) fall back to `get_user`.
+    """
     if not supabase:
         raise HTTPException(status_code=503, detail="Database service is not configured.")
+    token_key = hashlib.sha256(token.credentials.encode("utf-8")).hexdigest()
+    user = token_cache.get(token_key)
+    if user is not None:
+        return user
+
     try:
-        user_response = supabase.auth.get_user(token.credentials)
-        user = user_response.user
+        # May fetch the JWKS on first use, so keep it off the event loop.
+        user = await supabase_io.run(token_verifier.verify, token.credentials)
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token.")
+
+    if user is None:
+        try:
+            user_response = await supabase_io.run(supabase.auth.get_user, token.credentials)
+            user = user_response.user
+        except Exception:
+            raise HTTPException(status_code=401, detail="Invalid or expired token.")
         if not user:
              raise HTTPException(status_code=401, detail="User not found for token.")
-        return user
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid or expired token.")
+
+    ttl = token_cache_ttl(token.credentials, AUTH_TOKEN_CACHE_TTL_S)
+    if ttl > 0:
+        token_cache.set(token_key, user, ttl_seconds=ttl)
+    return user
 
 # ==============================================================================
 # 5. Application Startup Logic
@@ -200,47 +511,156 @@ def load_all_models():
         clinical_path = os.path.join(os.path.dirname(__file__), "b3_clinical_model.keras")
         models["clinical"] = load_model(clinical_path, compile=False)
         models["clinical_last_layer"] = find_last_conv_layer(models["clinical"])
+        models["clinical_grad_model"] = build_gradcam_model(models["clinical"], models["clinical_last_layer"])
         class_labels["clinical"] = ["Actinic Keratosis", "Basal Cell Carcinoma", "Benign Mole", "Dermatofibroma", "Melanoma", "Seborrheic Keratosis", "Vascular Lesion"]
         print("   ✅ Clinical Model (B3) and assets loaded successfully.")
 
         consumer_path = os.path.join(os.path.dirname(__file__), "b4_consumer_model.keras")
         models["consumer"] = load_model(consumer_path, compile=False)
         models["consumer_last_layer"] = find_last_conv_layer(models["consumer"])
+        models["consumer_grad_model"] = build_gradcam_model(models["consumer"], models["consumer_last_layer"])
         class_labels["consumer"] = ['Acne', 'Benign Mole', 'Eczema', 'Healthy skin', 'Melanoma Consumer', 'Psoriasis', 'Ringworm']
         print("   ✅ Consumer Model (B4) and assets loaded successfully.")
+
+        for model_type in ("clinical", "consumer"):
+            input_shape = (*MODEL_INPUT_SIZES[model_type], 3)
+            predictor = make_gradcam_predictor(
+                models[f"{model_type}_grad_model"], input_shape,
+                compiled=INFERENCE_COMPILE, jit_compile=INFERENCE_XLA, top_k=GRADCAM_TOP_K,
+            )
+            # Trace/compile now so the first real scan after a cold start doesn't pay for it.
+            # With XLA every padded batch bucket is its own executable, so warm them all.
+            warmup_sizes = [2 ** i for i in range((INFERENCE_MAX_BATCH_SIZE - 1).bit_length() + 1)] if INFERENCE_XLA else [1]
+            warmup_predictor(predictor, input_shape, batch_sizes=warmup_sizes)
+            batchers[model_type] = MicroBatcher(
+                model_type,
+                make_batch_predictor(predictor),
+                max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+                max_wait_ms=INFERENCE_MAX_WAIT_MS,
+                executor=inference_executor,
+            )
+        print(f"   ✅ Inference batching enabled (max batch {INFERENCE_MAX_BATCH_SIZE}, max wait {INFERENCE_MAX_WAIT_MS} ms).")
+        print(f"   ✅ Models warmed up (tf.function: {INFERENCE_COMPILE}, XLA: {INFERENCE_XLA}).")
+        readiness["models_ready"] = True
     except Exception as e:
         print("📂 Backend directory contents:", os.listdir(os.path.dirname(__file__)))
         print(f"❌ CRITICAL STARTUP ERROR: Could not load models. {e}")
         traceback.print_exc()
+
+@app.on_event("startup")
+async def open_http_client():
+    """Creates the shared, keep-alive HTTP/2 client used for all outbound fetches."""
+    global http_client
+    http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=HTTP_CLIENT_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_CLIENT_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_CLIENT_KEEPALIVE_EXPIRY_S,
+        ),
+        timeout=httpx.Timeout(HTTP_CLIENT_READ_TIMEOUT_S, connect=HTTP_CLIENT_CONNECT_TIMEOUT_S),
+        follow_redirects=True,
+    )
+
+@app.on_event("shutdown")
+async def close_http_client():
+    """Closes pooled connections."""
+    if http_client is not None:
+        await http_client.aclose()
+
+@app.on_event("shutdown")
+def shutdown_inference_executor():
+    """Stops the inference and render worker threads."""
+    inference_executor.shutdown()
+    render_executor.shutdown()
+
+@app.on_event("shutdown")
+def shutdown_supabase_io():
+    """Stops the Supabase I/O threads."""
+    supabase_io.shutdown()
+
+@app.on_event("shutdown")
+def shutdown_tts():
+    """Stops the speech synthesis threads."""
+    tts_cache.shutdown()
+
 # ==============================================================================
 # 6. Core Prediction & Analysis Logic
 # ==============================================================================
 
-async def get_full_prediction_results(model_type: str, image_bytes: bytes):
+def prepare_model_input(model_type: str, image: ImageContext) -> np.ndarray:
+    """Resizes and preprocesses a decoded upload into a single model input (no batch axis)."""
+    target_size = MODEL_INPUT_SIZES[model_type]
+    preprocess_fn = preprocess_b3 if model_type == "clinical" else preprocess_b4
+    # Cast first: the resized view is shared with other stages and must not be modified.
+    return preprocess_fn(image.resized_rgb(target_size).astype(np.float32))
+
+def render_heatmap_image(heatmap: np.ndarray, image: ImageContext) -> bytes:
     """
-    Internal function to run ML model and return full results including Top 3.
+    Blends a Grad-CAM over the decoded original, bounded to HEATMAP_MAX_EDGE, and encodes it
+    as HEATMAP_FORMAT (MIME type HEATMAP_MIME).
     """
-    target_size = (300, 300) if model_type == "clinical" else (380, 380)
-    preprocess_fn = preprocess_b3 if model_type == "clinical" else preprocess_b4
-    
-    pil_image_for_model = process_image(image_bytes, target_size=target_size)
-    img_array = preprocess_fn(np.array(pil_image_for_model))
-    img_array_expanded = np.expand_dims(img_array, axis=0)
+    overlay_img = apply_heatmap_overlay(image.bgr, heatmap, max_edge=HEATMAP_MAX_EDGE)
+    encoded, _ = encode_image(overlay_img, fmt=HEATMAP_FORMAT, quality=HEATMAP_QUALITY)
+    return encoded
+
+def heatmap_handle_path(key: str, mode: str, cam: str, expires: int) -> str:
+    """Canonical form of a deferred heatmap URL, the string its signature covers."""
+    return f"/api/v2/heatmaps/{key}?mode={mode}&cam={cam}&exp={expires}"
+
+async def create_heatmap_handle(request: Request, image_url: str, mode: str, cam) -> dict:
+    """
+    Returns the response fields pointing at a heatmap rendered on first access.
 
-    predictions = models[model_type].predict(img_array_expanded)[0]
+    The handle is stateless, so any instance can serve it: the URL carries the blob key of the
+    stored upload (see `store_blob`), the compact CAM and an expiry, all covered by a signature.
+    The URL is absolute, since the frontend is served from another origin.
+    """
+    encoded = encode_cam(cam)
+    key = blob_store.key_from_url(image_url)
+    cam_param = f"{encoded['shape'][0]}x{encoded['shape'][1]}.{encoded['data']}"
+    expires = int(time.time() + HEATMAP_HANDLE_TTL_S)
+    sig = sign_path(heatmap_handle_path(key, mode, cam_param, expires))
+    query = urlencode({"mode": mode, "cam": cam_param, "exp": expires, "sig": sig})
+    return {"heatmapImage": None, "heatmapUrl": f"{public_url(request, f'/api/v2/heatmaps/{key}')}?{query}"}
+
+def render_stored_heatmap(image_bytes: bytes, heatmap_cam: dict, max_edge: int) -> bytes:
+    """Renders a persisted compact CAM over its case image at the requested resolution."""
+    image = decode_image(image_bytes, (max_edge, max_edge))
+    overlay_img = apply_heatmap_overlay(image.bgr, decode_cam(heatmap_cam), max_edge=max_edge)
+    encoded, _ = encode_image(overlay_img, fmt=HEATMAP_FORMAT, quality=HEATMAP_QUALITY)
+    return encoded
+
+def render_heatmap_from_bytes(image_bytes: bytes, mode: str, cam: np.ndarray) -> bytes:
+    """Decodes an upload and renders its heatmap overlay; used for deferred and cached CAMs."""
+    return render_heatmap_image(cam, decode_image(image_bytes, MODEL_INPUT_SIZES[mode]))
+
+ANALYSIS_CACHE_SCHEMA = 4  # Bump when the shape of cached entries changes
+
+def analysis_cache_key(image_bytes: bytes, mode: str) -> str:
+    """Content-addressed key: identical uploads in the same mode and model version share a result."""
+    return f"analysis:v{ANALYSIS_CACHE_SCHEMA}:{hashlib.sha256(image_bytes).hexdigest()}:{mode}:{MODEL_VERSION}"
+
+def queue_full_exception(e: InferenceQueueFull) -> HTTPException:
+    """Maps a rejected inference admission to a fast 429 with a Retry-After hint."""
+    return HTTPException(
+        status_code=429,
+        detail="The analysis service is busy. Please retry shortly.",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+async def run_prediction_stage(model_type: str, image: ImageContext) -> dict:
+    """
+    Model forward pass. Returns the Top 3, the risk level, the raw Grad-CAM for
+    the top class (rendered later on its own schedule) and compact CAMs for the differential.
+    """
+    img_array = await inference_executor.run(prepare_model_input, model_type, image)
+
+    # Concurrent requests for the same model share one batched forward pass, which
+    # yields both the class probabilities and the top-k Grad-CAMs.
+    predictions, heatmaps = await batchers[model_type].submit(img_array)
     
     top3_indices = np.argsort(predictions)[-3:][::-1]
-    
-    last_conv_layer = models[f"{model_type}_last_layer"]
-    heatmap = generate_gradcam(img_array_expanded, models[model_type], last_conv_layer, class_index=top3_indices[0])
-    
-    original_pil = Image.open(BytesIO(image_bytes)).convert("RGB")
-    original_cv = cv2.cvtColor(np.array(original_pil), cv2.COLOR_RGB2BGR)
-    overlay_img = apply_heatmap_overlay(original_cv, heatmap)
-    
-    _, buffer = cv2.imencode('.jpg', overlay_img)
-    heatmap_base64 = base64.b64encode(buffer).decode('utf-8')
-
     top3_results = [
         {"label": class_labels[model_type][i], "confidence": round(float(predictions[i]) * 100, 2)}
         for i in top3_indices
@@ -249,8 +669,11 @@ async def get_full_prediction_results(model_type: str, image_bytes: bytes):
     return {
         "predictions": top3_results,
         "riskLevel": classify_risk(top3_results[0]["label"]),
-        "heatmapImage": f"data:image/jpeg;base64,{heatmap_base64}",
-        "originalImageBase64": base64.b64encode(image_bytes).decode('utf-8'),
+        "cam": heatmaps[0],
+        "differentials": [
+            {**top3_results[i], "cam": encode_cam(heatmaps[i])}
+            for i in range(min(len(heatmaps), len(top3_results)))
+        ],
     }
 
 async def get_vision_explanation(image_bytes: bytes, predictions: list, mode: str):
@@ -280,36 +703,253 @@ async def get_vision_explanation(image_bytes: bytes, predictions: list, mode: st
     response = await model.generate_content_async(prompt)
     return json.loads(clean_json_response(response.text))
 
+def make_speech_stream(text: str):
+    """Returns a factory for the (blocking) ElevenLabs audio stream of `text`."""
+    return lambda: elevenlabs_client.text_to_speech.convert(
+        voice_id=TTS_VOICE_ID,
+        text=text,
+        model_id=TTS_MODEL_ID
+    )
+
+def prefetch_explanation_speech(explanation: dict):
+    """
+    Starts synthesizing a consumer explanation's audio into the TTS cache, so a later
+    /api/v2/speak for the same text is served from disk or joins the running synthesis.
+    """
+    text = explanation.get("explanation_text")
+    if text:
+        tts_cache.prefetch(tts_cache.key(text, TTS_VOICE_ID, TTS_MODEL_ID), make_speech_stream(text))
+
 
 # ==============================================================================
 # 7. V2 "WOW" FACTOR ENDPOINTS (The New Standard)
 # ==============================================================================
 
+async def build_heatmap_fields(request: Request, heatmap_mode: str, contents: bytes, mode: str, cam,
+                               image_context: Optional[ImageContext] = None, cached_image: Optional[str] = None) -> dict:
+    """
+    Produces the heatmap part of an analysis response for the requested delivery mode:
+    "inline" (base64 data URI), "deferred" (short-lived URL) or "binary" (raw JPEG bytes
+    under the internal `heatmapBytes` key, for framed responses). Raises InferenceQueueFull
+    when a cached CAM needs rendering and the render queue is full.
+    """
+    if heatmap_mode == "deferred":
+        return await create_heatmap_handle(request, await store_blob(contents, sniff_content_type(contents)), mode, cam)
+    if cached_image:
+        if heatmap_mode == "inline":
+            return {"heatmapImage": cached_image}
+        return {"heatmapImage": None, "heatmapBytes": base64.b64decode(cached_image.split(",")[-1])}
+
+    cam = np.asarray(cam, dtype=np.float32)
+    if image_context is not None:
+        heatmap_bytes = await inference_executor.run(render_heatmap_image, cam, image_context)
+    else:
+        # Cached without an overlay: the CAM is stored, only the rendering is missing. This
+        # path holds no inference slot, so it is admitted to the render pool on its own.
+        async with render_executor.admit():
+            heatmap_bytes = await render_executor.run(render_heatmap_from_bytes, contents, mode, cam)
+    if heatmap_mode == "binary":
+        return {"heatmapImage": None, "heatmapBytes": heatmap_bytes}
+    return {"heatmapImage": f"data:{HEATMAP_MIME};base64,{base64.b64encode(heatmap_bytes).decode('utf-8')}"}
+
+
+async def build_differential_heatmaps(request: Request, differentials: list, cam_classes: int, heatmap_mode: str,
+                                      contents: bytes, mode: str) -> list:
+    """
+    Returns the per-class Grad-CAMs for the first `cam_classes` differential diagnoses as
+    compact raw CAMs, plus a render URL for each when heatmaps are deferred.
+    """
+    selected = [dict(item) for item in differentials[:cam_classes]]
+    if heatmap_mode == "deferred":
+        # Content-addressed, so this is the same blob the main heatmap handle points at.
+        image_url = await store_blob(contents, sniff_content_type(contents))
+        for item in selected:
+            item["heatmapUrl"] = (await create_heatmap_handle(request, image_url, mode, decode_cam(item["cam"])))["heatmapUrl"]
+    return selected
+
+
+async def run_analysis_stages(request: Request, contents: bytes, mode: str, heatmap_mode: str = "inline", echo_original: bool = True,
+                              cam_classes: int = 1, prefetch_speech: bool = False):
+    """
+    Runs the full analysis as an async generator of (stage, payload) pairs, emitted as soon
+    as each stage is ready: "quality", "prediction", "heatmap", "explanation" and finally
+    "result", whose payload is the complete /api/v2/analyze response.
+
+    heatmap_mode selects how the overlay is delivered (see build_heatmap_fields). With
+    echo_original=False the upload isn't copied back as `originalImageBase64`. With
+    cam_classes > 1 the heatmap stage also carries `differentialHeatmaps`. With
+    prefetch_speech=True a consumer explanation's audio is synthesized in the background
+    as soon as the explanation is available.
+    """
+    prefetch_speech = prefetch_speech and mode == "consumer"
+
+    def finish(result: dict) -> dict:
+        if echo_original:
+            result["originalImageBase64"] = base64.b64encode(contents).decode('utf-8')
+        return result
+
+    async def add_differentials(heatmap_fields: dict, differentials: list) -> dict:
+        if cam_classes > 1:
+            heatmap_fields["differentialHeatmaps"] = await build_differential_heatmaps(
+                request, differentials, cam_classes, heatmap_mode, contents, mode
+            )
+        return heatmap_fields
+
+    # Re-uploads (retries, lesion tracking) skip inference, Grad-CAM and Gemini entirely.
+    cache_key = analysis_cache_key(contents, mode)
+    cached = await asyncio.to_thread(analysis_cache.get, cache_key)
+    if cached is not None:
+        try:
+            heatmap_fields = await add_differentials(await build_heatmap_fields(
+                request, heatmap_mode, contents, mode, decode_cam(cached["heatmapCam"]),
+                cached_image=cached.get("heatmapImage"),
+            ), cached.get("differentials", []))
+        except InferenceQueueFull as e:
+            raise queue_full_exception(e)
+        if prefetch_speech:
+            prefetch_explanation_speech(cached["explanation"])
+        yield "quality", cached["quality"]
+        yield "prediction", {"prediction": cached["prediction"], "predictions": cached["predictions"]}
+        yield "heatmap", heatmap_fields
+        yield "explanation", {"explanation": cached["explanation"]}
+        yield "result", finish({
+            "prediction": cached["prediction"],
+            "explanation": cached["explanation"],
+            **heatmap_fields,
+            "heatmapCam": cached["heatmapCam"],
+        })
+        return
+
+    explanation_task = None
+    try:
+        try:
+            async with inference_executor.admit():
+                # Decode once; the quality check, model input and overlay all share this context.
+                image_context = await inference_executor.run(decode_image, contents, MODEL_INPUT_SIZES[mode])
+                quality_check = await inference_executor.run(check_image_quality, image_context, mode)
+                if not quality_check["is_clear"]:
+                    raise HTTPException(status_code=400, detail=quality_check["message"])
+                yield "quality", quality_check
+
+                prediction = await run_prediction_stage(mode, image_context)
+                prediction_summary = {
+                    "top1": prediction["predictions"][0],
+                    "top2": prediction["predictions"][1],
+                    "riskLevel": prediction["riskLevel"]
+                }
+
+                # Gemini only needs the upload and the Top 3, so start it now and render
+                # the heatmap while that round trip is in flight.
+                explanation_task = asyncio.create_task(
+                    get_vision_explanation(contents, prediction["predictions"], mode)
+                )
+                if prefetch_speech:
+                    # Fires the moment Gemini answers, even while the heatmap is still rendering.
+                    explanation_task.add_done_callback(
+                        lambda task: prefetch_explanation_speech(task.result())
+                        if not task.cancelled() and task.exception() is None else None
+                    )
+                yield "prediction", {"prediction": prediction_summary, "predictions": prediction["predictions"]}
+
+                heatmap_fields = await add_differentials(await build_heatmap_fields(
+                    request, heatmap_mode, contents, mode, prediction["cam"], image_context=image_context
+                ), prediction["differentials"])
+                yield "heatmap", heatmap_fields
+        except InferenceQueueFull as e:
+            raise queue_full_exception(e)
+
+        explanation_results = await explanation_task
+        yield "explanation", {"explanation": explanation_results}
+    finally:
+        if explanation_task is not None and not explanation_task.done():
+            explanation_task.cancel()
+
+    # The upload echo is cheap to rebuild from the request, so it isn't stored. The raw
+    # CAM is, so a later request can render (or defer) the heatmap without inference.
+    heatmap_cam = encode_cam(prediction["cam"])
+    cache_entry = {
+        "quality": quality_check,
+        "prediction": prediction_summary,
+        "predictions": prediction["predictions"],
+        "explanation": explanation_results,
+        "heatmapImage": heatmap_fields.get("heatmapImage"),
+        "heatmapCam": heatmap_cam,
+        "differentials": prediction["differentials"],
+    }
+    await asyncio.to_thread(analysis_cache.set, cache_key, cache_entry)
+    yield "result", finish({
+        "prediction": prediction_summary,
+        "explanation": explanation_results,
+        **heatmap_fields,
+        "heatmapCam": heatmap_cam,
+    })
+
+
+def build_multipart_response(result: dict) -> Response:
+    """
+    Frames an analysis as multipart/mixed: a JSON part with the result, followed by the
+    heatmap as a raw image part (when rendered) instead of an inline base64 string.
+    """
+    heatmap_bytes = result.pop("heatmapBytes", None)
+    boundary = uuid.uuid4().hex
+    parts = [("application/json", 'inline; name="result"', json.dumps(result).encode("utf-8"))]
+    if heatmap_bytes is not None:
+        extension = "webp" if HEATMAP_MIME == "image/webp" else "jpg"
+        parts.append((HEATMAP_MIME, f'inline; name="heatmap"; filename="heatmap.{extension}"', heatmap_bytes))
+
+    body = bytearray()
+    for content_type, disposition, data in parts:
+        body += (
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Disposition: {disposition}\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n"
+        ).encode("ascii")
+        body += data + b"\r\n"
+    body += f"--{boundary}--\r\n".encode("ascii")
+    return Response(content=bytes(body), media_type=f"multipart/mixed; boundary={boundary}")
+
+
+async def run_analysis(request: Request, contents: bytes, mode: str, **options) -> dict:
+    """Runs every analysis stage and returns only the final /api/v2/analyze result (see run_analysis_stages)."""
+    result = None
+    async for stage, payload in run_analysis_stages(request, contents, mode, **options):
+        if stage == "result":
+            result = payload
+    return result
+
+
 @app.post("/api/v2/analyze", tags=["V2 (Primary Flow)"])
-async def analyze_image_v2(image: UploadFile = File(...), mode: str = Query("consumer", enum=["consumer", "clinical"])):
+async def analyze_image_v2(
+    request: Request,
+    image: UploadFile = File(...),
+    mode: str = Query("consumer", enum=["consumer", "clinical"]),
+    heatmap: str = Query("inline", enum=["inline", "deferred"]),
+    response_format: str = Query("full", enum=["full", "lean", "multipart"]),
+    cam_classes: int = Query(1, ge=1, le=3),
+    prefetch_speech: bool = Query(TTS_PREFETCH),
+):
     """
     [V2] The new, primary endpoint for a complete analysis.
     Performs prediction and vision-based explanation in a single, efficient call.
+    Pass heatmap=deferred to get a short-lived `heatmapUrl` instead of an inline overlay.
+    response_format=lean drops the `originalImageBase64` echo of the upload; multipart
+    also drops it and sends the heatmap as a raw JPEG part after the JSON.
+    cam_classes > 1 adds `differentialHeatmaps`: a compact raw Grad-CAM per top class.
+    prefetch_speech (default: TTS_PREFETCH) starts synthesizing the consumer explanation's
+    audio in the background, so a following /api/v2/speak is ready sooner.
     """
     try:
         contents = await image.read()
-        quality_check = check_image_quality(contents)
-        if not quality_check["is_clear"]:
-            raise HTTPException(status_code=400, detail=quality_check["message"])
-        
-        prediction_results = await get_full_prediction_results(mode, contents)
-        explanation_results = await get_vision_explanation(contents, prediction_results["predictions"], mode)
-        
-        return {
-            "prediction": {
-                "top1": prediction_results["predictions"][0],
-                "top2": prediction_results["predictions"][1],
-                "riskLevel": prediction_results["riskLevel"]
-            },
-            "explanation": explanation_results,
-            "heatmapImage": prediction_results["heatmapImage"],
-            "originalImageBase64": prediction_results["originalImageBase64"]
-        }
+        if response_format == "multipart" and heatmap == "inline":
+            heatmap = "binary"
+        result = await run_analysis(
+            request, contents, mode, heatmap_mode=heatmap, echo_original=response_format == "full",
+            cam_classes=min(cam_classes, GRADCAM_TOP_K), prefetch_speech=prefetch_speech,
+        )
+        if response_format == "multipart":
+            return build_multipart_response(result)
+        return result
     except HTTPException as e:
         raise e
     except Exception:
@@ -317,22 +957,166 @@ async def analyze_image_v2(image: UploadFile = File(...), mode: str = Query("con
         raise HTTPException(status_code=500, detail="An error occurred during the full analysis.")
 
 
+@app.post("/api/v2/analyze/stream", tags=["V2 (Primary Flow)"])
+async def analyze_image_v2_stream(
+    request: Request,
+    image: UploadFile = File(...),
+    mode: str = Query("consumer", enum=["consumer", "clinical"]),
+    heatmap: str = Query("inline", enum=["inline", "deferred"]),
+    cam_classes: int = Query(1, ge=1, le=3),
+    prefetch_speech: bool = Query(TTS_PREFETCH),
+):
+    """
+    [V2] Progressive variant of /api/v2/analyze, streamed as NDJSON.
+    Emits one {"event": ..., "data": ...} line per stage (quality, prediction, heatmap,
+    explanation) as soon as it is ready, then a "result" line with the same object the
+    non-streaming endpoint returns. Failures after the first line arrive as an "error" event.
+    """
+    contents = await image.read()
+    stages = run_analysis_stages(request, contents, mode, heatmap_mode=heatmap,
+                                 cam_classes=min(cam_classes, GRADCAM_TOP_K), prefetch_speech=prefetch_speech)
+
+    # Run up to the quality check before committing to a 200, so unreadable or blurry
+    # images and a full inference queue still get a proper status code.
+    try:
+        first_stage = await anext(stages)
+    except HTTPException:
+        await stages.aclose()
+        raise
+    except Exception:
+        await stages.aclose()
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail="An error occurred during the full analysis.")
+
+    def to_line(stage: str, payload: dict) -> bytes:
+        return (json.dumps({"event": stage, "data": payload}) + "\n").encode("utf-8")
+
+    async def event_stream():
+        try:
+            yield to_line(*first_stage)
+            async for stage, payload in stages:
+                yield to_line(stage, payload)
+        except HTTPException as e:
+            yield to_line("error", {"status": e.status_code, "detail": e.detail})
+        except Exception:
+            print(traceback.format_exc())
+            yield to_line("error", {"status": 500, "detail": "An error occurred during the full analysis."})
+        finally:
+            await stages.aclose()
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+
+@app.get("/api/v2/heatmaps/{key}", tags=["V2 (Primary Flow)"])
+async def get_deferred_heatmap(
+    key: str,
+    mode: str = Query(..., enum=["consumer", "clinical"]),
+    cam: str = Query(...),
+    exp: int = Query(...),
+    sig: str = Query(...),
+):
+    """
+    [V2] Renders and returns the heatmap overlay for a deferred analysis. Everything needed is
+    in the signed URL (see `create_heatmap_handle`), so any instance can serve it; the
+    rendered overlay is cached per worker.
+    """
+    if not hmac.compare_digest(sig, sign_path(heatmap_handle_path(key, mode, cam, exp))):
+        raise HTTPException(status_code=403, detail="Invalid heatmap signature.")
+    remaining = exp - int(time.time())
+    if remaining <= 0 or not is_blob_key(key):
+        raise HTTPException(status_code=404, detail="Heatmap not found or expired. Please re-run the analysis.")
+    rendered = heatmap_store.get(sig)
+    if rendered is None:
+        try:
+            image_bytes = await supabase_io.run(blob_store.read, key)
+        except Exception:
+            print(traceback.format_exc())
+            raise HTTPException(status_code=404, detail="Heatmap not found or expired. Please re-run the analysis.")
+        shape, _, data = cam.partition(".")
+        heatmap_cam = decode_cam({"shape": [int(n) for n in shape.split("x")], "dtype": "uint8", "data": data})
+        try:
+            async with render_executor.admit():
+                rendered = await render_executor.run(render_heatmap_from_bytes, image_bytes, mode, heatmap_cam)
+        except InferenceQueueFull as e:
+            raise queue_full_exception(e)
+        except HTTPException as e:
+            raise e
+        except Exception:
+            print(traceback.format_exc())
+            raise HTTPException(status_code=500, detail="An error occurred while rendering the heatmap.")
+        heatmap_store.set(sig, rendered)
+    return Response(
+        content=rendered,
+        media_type=HEATMAP_MIME,
+        headers={"Cache-Control": f"private, max-age={remaining}"},
+    )
+
+
+def serve_cached_audio(path: str, request: Request) -> Response:
+    """Serves a cached audio file with ETag revalidation and byte-range support."""
+    etag = etag_for(path)
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    # FileResponse answers Range / If-Range requests with 206 partial content.
+    return FileResponse(path, media_type="audio/mpeg", headers=headers)
+
+async def stream_synthesis(synthesis) -> StreamingResponse:
+    """Streams a running synthesis from its first chunk; vendor errors surface as a 500 before any audio is sent."""
+    chunks = synthesis.stream()
+    first = await anext(chunks, None)
+
+    async def body():
+        if first is not None:
+            yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(body(), media_type="audio/mpeg")
+
 @app.post("/api/v2/speak", tags=["V2 (Primary Flow)"])
-async def text_to_speech_context_aware(request: SpeakRequest, risk_level: str = Query("low", enum=["low", "medium", "high"])):
-    """[V2] Converts text to speech using a voice appropriate for the risk level."""
+async def text_to_speech_context_aware(request: SpeakRequest, http_request: Request, risk_level: str = Query("low", enum=["low", "medium", "high"])):
+    """
+    [V2] Converts text to speech using a voice appropriate for the risk level.
+
+    Audio is cached per (text, voice, model) when TTS_CACHE_DIR is set. Replays are served
+    from disk with Range and ETag support; a miss is synthesized off the event loop and
+    streamed to the client while it is written to the cache. Content-Location points at a
+    GET URL for the same audio, which media players can seek in. Audio prefetched after an
+    analysis is also held in memory for TTS_PREFETCH_STORE_TTL_S, with or without a disk.
+    """
     try:
-        voice_id = "21m00Tcm4TlvDq8ikWAM" # "Rachel" - a standard, high-quality voice
-        
-        audio_stream = elevenlabs_client.text_to_speech.convert(
-            voice_id=voice_id,
-            text=request.text_to_speak,
-            model_id="eleven_multilingual_v2"
-        )
-        return StreamingResponse(audio_stream, media_type="audio/mpeg")
+        key = tts_cache.key(request.text_to_speak, TTS_VOICE_ID, TTS_MODEL_ID)
+        path = tts_cache.cached_path(key)
+        prefetched = tts_cache.prefetched_audio(key) if path is None else None
+        if path is not None:
+            response = serve_cached_audio(path, http_request)
+        elif prefetched is not None:
+            response = Response(content=prefetched, media_type="audio/mpeg", headers={"Cache-Control": "private, max-age=86400"})
+        else:
+            # Joins a prefetch of the same explanation if one is still running.
+            response = await stream_synthesis(tts_cache.synthesize(key, make_speech_stream(request.text_to_speak)))
+        if tts_cache.disk is not None:
+            response.headers["Content-Location"] = public_url(http_request, f"/api/v2/speak/audio/{tts_cache.audio_id(key)}")
+        return response
     except Exception as e:
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Failed to generate context-aware audio: {e}")
 
+@app.get("/api/v2/speak/audio/{audio_id}", tags=["V2 (Primary Flow)"])
+async def get_speech_audio(audio_id: str, request: Request):
+    """Replays previously synthesized audio (range requests and ETags supported), or joins its synthesis if still running."""
+    path = tts_cache.path_for_audio_id(audio_id)
+    if path is not None:
+        return serve_cached_audio(path, request)
+    synthesis = tts_cache.in_flight(audio_id=audio_id)
+    if synthesis is None:
+        raise HTTPException(status_code=404, detail="Audio not found.")
+    try:
+        return await stream_synthesis(synthesis)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate audio: {e}")
+
 
 # ==============================================================================
 # 8. Clinical & Dashboard Endpoints
@@ -357,19 +1141,22 @@ async def submit_case_for_review(request: SubmitCaseRequest, current_user: dict
     if not supabase:
         raise HTTPException(status_code=503, detail="Database service is not configured.")
     try:
-        case_uuid = uuid.uuid4()
-        bucket_name = "case-images"
-        
-        original_image_data = base64.b64decode(request.image_base64)
-        original_image_path = f"cases/{current_user.id}/{case_uuid}_original.jpg"
-        supabase.storage.from_(bucket_name).upload(file=original_image_data, path=original_image_path, file_options={"content-type": "image/jpeg"})
-        original_image_url = supabase.storage.from_(bucket_name).get_public_url(original_image_path)
-
-        heatmap_base64_data = request.heatmap_image_base64.split(',')[-1]
-        heatmap_image_data = base64.b64decode(heatmap_base64_data)
-        heatmap_image_path = f"cases/{current_user.id}/{case_uuid}_heatmap.jpg"
-        supabase.storage.from_(bucket_name).upload(file=heatmap_image_data, path=heatmap_image_path, file_options={"content-type": "image/jpeg"})
-        heatmap_image_url = supabase.storage.from_(bucket_name).get_public_url(heatmap_image_path)
+        original_mime, original_image_data = parse_data_uri(request.image_base64)
+        uploads = [store_blob(original_image_data, original_mime)]
+
+        # A raw CAM is a few hundred bytes and renders on demand, so no heatmap image is stored.
+        heatmap_image_data = None
+        if request.heatmap_cam is None:
+            if not request.heatmap_image_base64:
+                raise HTTPException(status_code=422, detail="Either heatmap_cam or heatmap_image_base64 is required.")
+            heatmap_mime, heatmap_image_data = parse_data_uri(request.heatmap_image_base64)
+            uploads.append(store_blob(heatmap_image_data, heatmap_mime))
+
+        # Uploads and list renditions run concurrently, so this waits for the slowest rather than their sum.
+        renditions, original_image_url, *heatmap_urls = await asyncio.gather(
+            store_renditions(original_image_data, request.heatmap_cam, heatmap_image_data), *uploads
+        )
+        heatmap_image_url = heatmap_urls[0] if heatmap_urls else None
 
         # FIX: Determine the status based on the 'is_private' flag.
         status = "private" if request.is_private else "new"
@@ -377,6 +1164,8 @@ async def submit_case_for_review(request: SubmitCaseRequest, current_user: dict
         db_payload = {
             "image_url": original_image_url,
             "heatmap_image_url": heatmap_image_url,
+            "heatmap_cam": request.heatmap_cam,
+            "renditions": renditions,
             "predictions": request.predictions,
             "risk_level": request.risk_level,
             "ai_explanation": request.ai_explanation,
@@ -385,19 +1174,40 @@ async def submit_case_for_review(request: SubmitCaseRequest, current_user: dict
             "lesion_id": request.lesion_id
         }
         
-        data, error = supabase.table("cases").insert(db_payload).execute()
+        data, error = await supabase_io.execute(supabase.table("cases").insert(db_payload))
         
         if error and not isinstance(error, tuple):
             raise Exception(str(error.message))
 
+        # Private cases never reach the dashboard; only their lesion's scan list changes.
+        stale_tags = [] if request.is_private else ["cases:head"]
+        if request.lesion_id is not None:
+            stale_tags.append(f"lesion:{request.lesion_id}")
+            schedule_lesion_comparison(request.lesion_id, current_user.id)
+        if stale_tags:
+            case_cache.invalidate(*stale_tags)
+
         return {"status": "success", "caseId": data[1][0]['id']}
+    except HTTPException as e:
+        raise e
     except Exception as e:
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Error submitting case: {e}")
 
 @app.get("/api/cases", tags=["Dashboard Actions"])
-async def get_all_cases():
-    """Retrieves all submitted cases from Supabase for the doctor's dashboard."""
+async def get_all_cases(
+    request: Request,
+    response: Response,
+    limit: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_PAGE_MAX),
+    cursor: Optional[int] = Query(None, description="Value of X-Next-Cursor from the previous page."),
+    status: Optional[str] = Query(None),
+    risk_level: Optional[str] = Query(None),
+):
+    """
+    Retrieves a page of submitted cases for the doctor's dashboard, newest first.
+    Rows carry list columns only; use GET /api/cases/{case_id} for the full case.
+    Pages are cached briefly and evicted by the writes that change them.
+    """
     if not supabase:
         return [{
             "id": 101, "predictions": [{"label": "Melanoma", "confidence": 81.0}],
@@ -407,36 +1217,74 @@ async def get_all_cases():
             "heatmap_image_url": "https://via.placeholder.com/150"
         }]
     try:
-        # This is the only line you need to change:
-        data, error = (
-            supabase.table("cases")
-            .select("*, profiles:patient_id(full_name)")
-            .neq("status", "private")
-            .order("id", desc=True)
-            .execute()
-        )
-        print(data)
-
-        if error and not isinstance(error, tuple):
-            raise Exception(str(error))
-
-        return data[1]
+        cache_key = ("cases", limit, cursor, status, risk_level)
+        rows = case_cache.get(cache_key)
+        if rows is None:
+            generation = case_cache.generation()
+            query = supabase.table("cases").select(CASE_LIST_COLUMNS).neq("status", "private")
+            if status:
+                query = query.eq("status", status)
+            if risk_level:
+                query = query.eq("risk_level", risk_level)
+            data, error = await supabase_io.execute(keyset_page(query, limit, cursor))
+
+            if error and not isinstance(error, tuple):
+                raise Exception(str(error))
+
+            rows = data[1]
+            tags = [f"case:{row['id']}" for row in rows]
+            if cursor is None:
+                tags.append("cases:head")
+            if status:
+                tags.append(f"cases:status:{status}")
+            case_cache.set(cache_key, rows, tags, generation)
+
+        # Copy, since heatmap URLs are attached per request.
+        return attach_media_urls(finish_page([dict(row) for row in rows], limit, response), request)
     except Exception as e:
         import traceback
         print(traceback.format_exc())
         from fastapi import HTTPException
         raise HTTPException(status_code=500, detail=f"Error retrieving cases: {e}")
 
+@app.get("/api/cases/{case_id}", tags=["Dashboard Actions"])
+async def get_case(case_id: int, request: Request):
+    """Retrieves the full record of a single submitted case."""
+    if not supabase:
+        raise HTTPException(status_code=503, detail="Database service is not configured.")
+    try:
+        case = case_cache.get(("case", case_id))
+        if case is None:
+            generation = case_cache.generation()
+            data, error = await supabase_io.execute(
+                supabase.table("cases")
+                .select("*, profiles:patient_id(full_name)")
+                .eq("id", case_id)
+                .neq("status", "private")
+            )
+            if error and not isinstance(error, tuple):
+                raise Exception(str(error))
+            if not data[1]:
+                raise HTTPException(status_code=404, detail=f"Case with ID {case_id} not found.")
+            case = data[1][0]
+            case_cache.set(("case", case_id), case, [f"case:{case_id}"], generation)
+        return attach_media_urls([dict(case)], request)[0]
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"Error retrieving case: {e}")
+
 @app.put("/api/cases/{case_id}/status", tags=["Dashboard Actions"])
 async def update_case(case_id: int, request: CaseUpdateRequest):
     """Updates a case's status and notes in Supabase."""
     if not supabase:
         raise HTTPException(status_code=503, detail="Database service is not configured.")
     try:
-        data, error = supabase.table("cases").update({
+        data, error = await supabase_io.execute(supabase.table("cases").update({
             "status": request.status,
             "notes": request.notes
-        }).eq("id", case_id).execute()
+        }).eq("id", case_id))
         
         if error and not isinstance(error, tuple):
              raise Exception(str(error))
@@ -444,11 +1292,50 @@ async def update_case(case_id: int, request: CaseUpdateRequest):
         if not data[1]:
              raise HTTPException(status_code=404, detail=f"Case with ID {case_id} not found or update failed.")
 
+        # Evict every cached page holding this case, plus the pages filtered by its new status.
+        # (Private cases are never listed and only enter the dashboard through submission.)
+        case_cache.invalidate(f"case:{case_id}", f"cases:status:{request.status}")
+
         return {"status": "success", "updatedCase": data[1][0]}
     except Exception as e:
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Error updating case: {e}")
 
+@app.get("/api/cases/{case_id}/heatmap", tags=["Dashboard Actions"])
+async def render_case_heatmap(case_id: int, sig: str = Query(...), max_edge: int = Query(HEATMAP_MAX_EDGE, ge=64, le=4096)):
+    """
+    Renders a case's heatmap overlay on demand from its stored raw CAM, at any resolution.
+    URLs are handed out (signed) by the listing endpoints.
+    """
+    path = f"/api/cases/{case_id}/heatmap"
+    if not hmac.compare_digest(sig, sign_path(path)):
+        raise HTTPException(status_code=403, detail="Invalid heatmap signature.")
+    if not supabase:
+        raise HTTPException(status_code=503, detail="Database service is not configured.")
+
+    rendered = case_heatmap_cache.get((case_id, max_edge))
+    if rendered is None:
+        try:
+            data, error = await supabase_io.execute(supabase.table("cases").select("image_url, heatmap_cam").eq("id", case_id))
+            if error and not isinstance(error, tuple):
+                raise Exception(str(error))
+            if not data[1] or not data[1][0].get("heatmap_cam"):
+                raise HTTPException(status_code=404, detail="No stored heatmap for this case.")
+            case = data[1][0]
+            image_bytes = await load_image_bytes(case["image_url"])
+            async with render_executor.admit():
+                rendered = await render_executor.run(render_stored_heatmap, image_bytes, case["heatmap_cam"], max_edge)
+        except InferenceQueueFull as e:
+            raise queue_full_exception(e)
+        except HTTPException as e:
+            raise e
+        except Exception as e:
+            print(traceback.format_exc())
+            raise HTTPException(status_code=500, detail=f"Error rendering heatmap: {e}")
+        case_heatmap_cache.set((case_id, max_edge), rendered)
+
+    return Response(content=rendered, media_type=HEATMAP_MIME, headers={"Cache-Control": "private, max-age=3600"})
+
 # ==============================================================================
 # 9. Patient Authentication Endpoints (For Future Lesion Tracking)
 # ==============================================================================
@@ -459,7 +1346,7 @@ async def get_my_profile(current_user: dict = Depends(get_current_user)):
     if not supabase:
         raise HTTPException(status_code=503, detail="Database service is not configured.")
     try:
-        data, error = supabase.table("profiles").select("*").eq("id", current_user.id).single().execute()
+        data, error = await supabase_io.execute(supabase.table("profiles").select("*").eq("id", current_user.id).single())
 
         if error and not isinstance(error, tuple):
             raise HTTPException(status_code=404, detail="User profile not found.")
@@ -477,7 +1364,7 @@ async def patient_signup(request: PatientSignupRequest):
         raise HTTPException(status_code=503, detail="Database service is not configured.")
     try:
         # Step 1: Create the user in Supabase Auth. This is all this function will do now.
-        auth_response = supabase.auth.sign_up({
+        auth_response = await supabase_io.run(supabase.auth.sign_up, {
             "email": request.email,
             "password": request.password,
             # Pass the full_name in the user_metadata so the trigger can access it
@@ -506,7 +1393,7 @@ async def patient_login(request: PatientLoginRequest):
     if not supabase:
         raise HTTPException(status_code=503, detail="Database service is not configured.")
     try:
-        response = supabase.auth.sign_in_with_password({
+        response = await supabase_io.run(supabase.auth.sign_in_with_password, {
             "email": request.email,
             "password": request.password
         })
@@ -523,7 +1410,7 @@ async def patient_login(request: PatientLoginRequest):
 async def create_lesion(request: LesionCreateRequest, current_user: dict = Depends(get_current_user)):
     """Creates a new lesion record for the currently authenticated patient."""
     db_payload = { "patient_id": current_user.id, "body_part": request.body_part, "nickname": request.nickname }
-    data, error = supabase.table("lesions").insert(db_payload).execute()
+    data, error = await supabase_io.execute(supabase.table("lesions").insert(db_payload))
     if error and not isinstance(error, tuple):
         raise HTTPException(status_code=500, detail=str(error))
     return data[1][0]
@@ -531,49 +1418,62 @@ async def create_lesion(request: LesionCreateRequest, current_user: dict = Depen
 @app.get("/api/lesions", tags=["Lesion Tracking"])
 async def get_patient_lesions(current_user: dict = Depends(get_current_user)):
     """Gets all tracked lesions for the currently authenticated patient."""
-    data, error = supabase.table("lesions").select("*").eq("patient_id", current_user.id).order("id", desc=True).execute()
+    data, error = await supabase_io.execute(supabase.table("lesions").select("*").eq("patient_id", current_user.id).order("id", desc=True))
     if error and not isinstance(error, tuple):
         raise HTTPException(status_code=500, detail=str(error))
     return data[1]
 
 @app.get("/api/lesions/{lesion_id}/scans", tags=["Lesion Tracking"])
-async def get_lesion_scans(lesion_id: int, current_user: dict = Depends(get_current_user)):
+async def get_lesion_scans(lesion_id: int, request: Request, current_user: dict = Depends(get_current_user)):
     """Gets all scans for a specific lesion belonging to the current patient."""
-    data, error = supabase.table("cases").select("*").eq("lesion_id", lesion_id).eq("patient_id", current_user.id).order("submitted_at", desc=True).execute()
-    if error and not isinstance(error, tuple):
-        raise HTTPException(status_code=500, detail=str(error))
-    return data[1]
+    cache_key = ("lesion_scans", current_user.id, lesion_id)
+    rows = case_cache.get(cache_key)
+    if rows is None:
+        generation = case_cache.generation()
+        data, error = await supabase_io.execute(supabase.table("cases").select("*").eq("lesion_id", lesion_id).eq("patient_id", current_user.id).order("submitted_at", desc=True))
+        if error and not isinstance(error, tuple):
+            raise HTTPException(status_code=500, detail=str(error))
+        rows = data[1]
+        case_cache.set(cache_key, rows, [f"lesion:{lesion_id}"] + [f"case:{row['id']}" for row in rows], generation)
+    return attach_media_urls([dict(row) for row in rows], request)
 
 @app.delete("/api/lesions/{lesion_id}", tags=["Lesion Tracking"])
 async def delete_lesion(lesion_id: int, current_user: dict = Depends(get_current_user)):
     """Deletes a lesion and all its associated scans for the current patient."""
-    data, error = supabase.table("lesions").delete().eq("id", lesion_id).eq("patient_id", current_user.id).execute()
+    data, error = await supabase_io.execute(supabase.table("lesions").delete().eq("id", lesion_id).eq("patient_id", current_user.id))
 
     if error and not isinstance(error, tuple):
         raise HTTPException(status_code=500, detail=f"Failed to delete lesion: {error.message}")
 
     if not data or not data[1]:
         raise HTTPException(status_code=404, detail="Lesion not found or you do not have permission to delete it.")
-    
+
+    case_cache.invalidate(f"lesion:{lesion_id}")
     return {"message": "Lesion and all associated scans deleted successfully."}
 
 
 @app.post("/api/lesions/{lesion_id}/scans", tags=["Lesion Tracking"])
-async def add_scan_to_lesion(lesion_id: int, image: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
+async def add_scan_to_lesion(lesion_id: int, request: Request, image: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
     """Performs a full analysis and saves it as a scan for a specific lesion."""
-    lesion_res_data, lesion_res_error = supabase.table("lesions").select("id").eq("id", lesion_id).eq("patient_id", current_user.id).execute()
+    lesion_res_data, lesion_res_error = await supabase_io.execute(supabase.table("lesions").select("id").eq("id", lesion_id).eq("patient_id", current_user.id))
     if lesion_res_error and not isinstance(lesion_res_error, tuple):
         raise HTTPException(status_code=500, detail=str(lesion_res_error))
     if not lesion_res_data[1]:
         raise HTTPException(status_code=404, detail="Lesion not found or access denied.")
 
-    analysis_results = await analyze_image_v2(image, mode="consumer")
+    try:
+        analysis_results = await run_analysis(request, await image.read(), "consumer")
+    except HTTPException as e:
+        raise e
+    except Exception:
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail="An error occurred during the full analysis.")
     
     prediction_data = analysis_results["prediction"]
     
     submit_req = SubmitCaseRequest(
         image_base64=analysis_results["originalImageBase64"],
-        heatmap_image_base64=analysis_results["heatmapImage"],
+        heatmap_cam=analysis_results["heatmapCam"],
         predictions=[prediction_data["top1"], prediction_data["top2"]],
         risk_level=prediction_data["riskLevel"],
         ai_explanation=analysis_results["explanation"]["explanation_text"],
@@ -592,7 +1492,7 @@ async def get_comparison_explanation(image1_bytes: bytes, image2_bytes: bytes, a
     """
     Uses Gemini's multimodal capabilities to compare two scans of the same lesion.
     """
-    model = genai.GenerativeModel("gemini-2.0-flash")
+    model = genai.GenerativeModel(COMPARISON_MODEL)
 
     img1_part = {"mime_type": "image/jpeg", "data": image1_bytes}
     img2_part = {"mime_type": "image/jpeg", "data": image2_bytes}
@@ -627,55 +1527,117 @@ async def get_comparison_explanation(image1_bytes: bytes, image2_bytes: bytes, a
     return json.loads(clean_json_response(response.text))
 
 
+def comparison_key(previous_scan: dict, latest_scan: dict) -> str:
+    return f"comparison:{previous_scan['id']}:{latest_scan['id']}:{COMPARISON_PROMPT_VERSION}:{COMPARISON_MODEL}"
+
+async def fetch_latest_scan_pair(lesion_id: int, patient_id):
+    """Returns (previous_scan, latest_scan) for a lesion, or None if it has fewer than two scans."""
+    data, error = await supabase_io.execute(
+        supabase.table("cases")
+        .select("id, image_url, predictions, submitted_at")
+        .eq("lesion_id", lesion_id)
+        .eq("patient_id", patient_id)
+        .order("submitted_at", desc=True)
+        .limit(2)
+    )
+    if error and not isinstance(error, tuple):
+         raise Exception(str(error))
+    scans = data[1]
+    if len(scans) < 2:
+        return None
+    return scans[1], scans[0]
+
+async def compute_scan_comparison(previous_scan: dict, latest_scan: dict) -> dict:
+    """Downloads both scans and asks Gemini to describe how the lesion changed."""
+    # Both downloads share the pooled client and run concurrently.
+    latest_image_bytes, previous_image_bytes = await asyncio.gather(
+        load_image_bytes(latest_scan['image_url']),
+        load_image_bytes(previous_scan['image_url']),
+    )
+
+    from datetime import datetime, timezone
+    
+    def parse_datetime(dt_str):
+        try:
+            return datetime.strptime(dt_str, "%Y-%m-%dT%H:%M:%S.%f%z")
+        except ValueError:
+            return datetime.strptime(dt_str, "%Y-%m-%dT%H:%M:%S%z")
+
+    t1 = parse_datetime(previous_scan['submitted_at'])
+    t2 = parse_datetime(latest_scan['submitted_at'])
+    
+    time_difference = t2 - t1
+    days_diff = time_difference.days
+    
+    return await get_comparison_explanation(
+        image1_bytes=previous_image_bytes,
+        image2_bytes=latest_image_bytes,
+        analysis1=previous_scan,
+        analysis2=latest_scan,
+        time_diff_str=f"{days_diff} days"
+    )
+
+async def get_or_compute_comparison(previous_scan: dict, latest_scan: dict) -> dict:
+    """
+    Serves a scan pair's comparison from the store, joining an in-flight computation
+    if one is running, and computes (then stores) it only when neither exists.
+    """
+    key = comparison_key(previous_scan, latest_scan)
+    cached = await asyncio.to_thread(comparison_cache.get, key)
+    if cached is not None:
+        return cached
+
+    task = comparison_tasks.get(key)
+    if task is None:
+        async def compute():
+            try:
+                result = await compute_scan_comparison(previous_scan, latest_scan)
+                await asyncio.to_thread(comparison_cache.set, key, result)
+                return result
+            finally:
+                comparison_tasks.pop(key, None)
+
+        task = asyncio.create_task(compute())
+        comparison_tasks[key] = task
+    # Shielded so a viewer disconnecting doesn't cancel the shared computation.
+    return await asyncio.shield(task)
+
+async def refresh_lesion_comparison(lesion_id: int, patient_id):
+    """Background job: precomputes the comparison for a lesion's two latest scans."""
+    try:
+        pair = await fetch_latest_scan_pair(lesion_id, patient_id)
+        if pair is not None:
+            await get_or_compute_comparison(*pair)
+    except Exception:
+        print(f"⚠️ Background comparison for lesion {lesion_id} failed:")
+        print(traceback.format_exc())
+
+def schedule_lesion_comparison(lesion_id: int, patient_id):
+    """Compares a lesion's new scan with the previous one in the background, so the comparison page is already cached."""
+    task = asyncio.create_task(refresh_lesion_comparison(lesion_id, patient_id))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
 @app.get("/api/lesions/{lesion_id}/compare", tags=["Lesion Tracking"])
 async def compare_lesion_scans(lesion_id: int, current_user: dict = Depends(get_current_user)):
-    """Compares the two most recent scans for a given lesion and provides an AI analysis."""
+    """
+    Compares the two most recent scans for a given lesion and provides an AI analysis.
+    Results are stored per scan pair, so repeat views don't re-run the comparison.
+    """
     if not supabase:
         raise HTTPException(status_code=503, detail="Database service is not configured.")
         
     try:
-        data, error = supabase.table("cases").select("*").eq("lesion_id", lesion_id).eq("patient_id", current_user.id).order("submitted_at", desc=True).limit(2).execute()
-        
-        if error and not isinstance(error, tuple):
-             raise Exception(str(error))
-        
-        scans = data[1]
-        if len(scans) < 2:
+        pair = await fetch_latest_scan_pair(lesion_id, current_user.id)
+        if pair is None:
             raise HTTPException(status_code=404, detail="Fewer than two scans found for this lesion. Comparison not possible.")
 
-        latest_scan = scans[0]
-        previous_scan = scans[1]
-        
-        async with httpx.AsyncClient() as client:
-            latest_image_res = await client.get(latest_scan['image_url'])
-            previous_image_res = await client.get(previous_scan['image_url'])
-            latest_image_res.raise_for_status()
-            previous_image_res.raise_for_status()
-
-        from datetime import datetime, timezone
-        
-        def parse_datetime(dt_str):
-            try:
-                return datetime.strptime(dt_str, "%Y-%m-%dT%H:%M:%S.%f%z")
-            except ValueError:
-                return datetime.strptime(dt_str, "%Y-%m-%dT%H:%M:%S%z")
-
-        t1 = parse_datetime(previous_scan['submitted_at'])
-        t2 = parse_datetime(latest_scan['submitted_at'])
-        
-        time_difference = t2 - t1
-        days_diff = time_difference.days
-        
-        comparison_result = await get_comparison_explanation(
-            image1_bytes=previous_image_res.content,
-            image2_bytes=latest_image_res.content,
-            analysis1=previous_scan,
-            analysis2=latest_scan,
-            time_diff_str=f"{days_diff} days"
-        )
-        
-        return comparison_result
+        previous_scan, latest_scan = pair
+        return await get_or_compute_comparison(previous_scan, latest_scan)
 
+    except HTTPException as e:
+        raise e
     except Exception as e:
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"An error occurred during comparison: {str(e)}")
@@ -691,9 +1653,23 @@ async def save_scan_to_history(request: SubmitCaseRequest, current_user: dict =
     if not supabase:
         raise HTTPException(status_code=503, detail="Database service is not configured.")
     try:
+        # Rows keep only blob URLs; the bytes are stored once per distinct image.
+        image_mime, image_data = parse_data_uri(request.image_base64)
+        uploads = [store_blob(image_data, image_mime)]
+        # Prefer the compact raw CAM; the overlay is rendered on demand from it.
+        heatmap_data = None
+        if not request.heatmap_cam and request.heatmap_image_base64:
+            heatmap_mime, heatmap_data = parse_data_uri(request.heatmap_image_base64)
+            uploads.append(store_blob(heatmap_data, heatmap_mime))
+        renditions, image_url, *heatmap_urls = await asyncio.gather(
+            store_renditions(image_data, request.heatmap_cam, heatmap_data), *uploads
+        )
+
         db_payload = {
-            "image_url": request.image_base64, # decode this if needed!
-            "heatmap_image_url": request.heatmap_image_base64,
+            "image_url": image_url,
+            "heatmap_image_url": heatmap_urls[0] if heatmap_urls else None,
+            "heatmap_cam": request.heatmap_cam,
+            "renditions": renditions,
             "predictions": request.predictions,
             "risk_level": request.risk_level,
             "ai_explanation": request.ai_explanation,
@@ -702,9 +1678,12 @@ async def save_scan_to_history(request: SubmitCaseRequest, current_user: dict =
             "patient_id": current_user.id,
             "lesion_id": request.lesion_id
         }
-        data, error = supabase.table("cases").insert(db_payload).execute()
+        data, error = await supabase_io.execute(supabase.table("cases").insert(db_payload))
         if error and not isinstance(error, tuple):
             raise Exception(str(error))
+        if request.lesion_id is not None:
+            case_cache.invalidate(f"lesion:{request.lesion_id}")
+            schedule_lesion_comparison(request.lesion_id, current_user.id)
         return {"status": "success", "caseId": data[1][0]['id']}
     except Exception as e:
         print(traceback.format_exc())
@@ -715,45 +1694,111 @@ async def save_scan_to_history(request: SubmitCaseRequest, current_user: dict =
 
 
 @app.get("/api/patient/scans/history", tags=["Patient Dashboard"])
-async def get_scan_history(current_user: dict = Depends(get_current_user)):
+async def get_scan_history(
+    request: Request,
+    response: Response,
+    limit: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_PAGE_MAX),
+    cursor: Optional[int] = Query(None, description="Value of X-Next-Cursor from the previous page."),
+    current_user: dict = Depends(get_current_user),
+):
     """
-    Returns only scans user chose to save as history.
+    Returns a page of the scans the user chose to save as history, newest first.
+    The explanation is omitted here; fetch it from GET /api/patient/scans/{case_id}.
     """
-    data, error = supabase.table("cases")\
-        .select("id, lesion_id, image_url, predictions, risk_level, submitted_at, ai_explanation, heatmap_image_url")\
+    query = supabase.table("cases")\
+        .select(HISTORY_LIST_COLUMNS)\
         .eq("patient_id", current_user.id)\
-        .eq("history", True)\
-        .order("submitted_at", desc=True)\
-        .execute()
-    print(data)
+        .eq("history", True)
+    data, error = await supabase_io.execute(keyset_page(query, limit, cursor))
     if error and not isinstance(error, tuple):
         raise HTTPException(status_code=500, detail=str(error))
-    return data[1]
+    return attach_media_urls(finish_page(data[1], limit, response), request)
+
+@app.get("/api/patient/scans/{case_id}", tags=["Patient Dashboard"])
+async def get_patient_scan(case_id: int, request: Request, current_user: dict = Depends(get_current_user)):
+    """
+    Returns the full record of one of the user's own scans.
+    """
+    data, error = await supabase_io.execute(supabase.table("cases")\
+        .select("*")\
+        .eq("id", case_id)\
+        .eq("patient_id", current_user.id))
+    if error and not isinstance(error, tuple):
+        raise HTTPException(status_code=500, detail=str(error))
+    if not data[1]:
+        raise HTTPException(status_code=404, detail="Scan not found.")
+    return attach_media_urls(data[1], request)[0]
 
 @app.get("/api/patient/reviews", tags=["Patient Dashboard"])
-async def get_professional_reviews(current_user: dict = Depends(get_current_user)):
+async def get_professional_reviews(
+    request: Request,
+    response: Response,
+    limit: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_PAGE_MAX),
+    cursor: Optional[int] = Query(None, description="Value of X-Next-Cursor from the previous page."),
+    current_user: dict = Depends(get_current_user),
+):
     """
-    Returns all cases where the user requested a professional review (non-private, any status).
+    Returns a page of the cases where the user requested a professional review (non-private, any status).
     """
-    data, error = supabase.table("cases")\
-        .select("id, image_url, predictions, submitted_at, status, notes")\
+    query = supabase.table("cases")\
+        .select(REVIEW_LIST_COLUMNS)\
         .eq("patient_id", current_user.id)\
-        .neq("status", "private")\
-        .order("submitted_at", desc=True)\
-        .execute()
+        .neq("status", "private")
+    data, error = await supabase_io.execute(keyset_page(query, limit, cursor))
     if error and not isinstance(error, tuple):
         raise HTTPException(status_code=500, detail=str(error))
+    rows = attach_media_urls(finish_page(data[1], limit, response), request)
     # Rename notes to doctor_notes for frontend compatibility
-    for item in data[1]:
+    for item in rows:
         item["doctor_notes"] = item.pop("notes", "")
-    return data[1]
+    return rows
 
 
 
+@app.get("/blobs/{key}", tags=["Patient Dashboard"])
+async def get_blob(key: str, sig: str = Query(...)):
+    """
+    Serves a stored image. URLs are handed out (signed) by the listing endpoints, since
+    scans are patient data. Local blobs are served directly; Supabase blobs redirect to a
+    short-lived signed storage URL. Keys are content hashes, so local responses never change.
+    """
+    if not hmac.compare_digest(sig, sign_path(f"/blobs/{key}")):
+        raise HTTPException(status_code=403, detail="Invalid blob signature.")
+    if not is_blob_key(key):
+        raise HTTPException(status_code=404, detail="Blob not found.")
+    if isinstance(blob_store, LocalBlobStore):
+        path = blob_store.path_for(key)
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail="Blob not found.")
+        return FileResponse(path, media_type=content_type_for(key), headers={"Cache-Control": "private, max-age=31536000, immutable"})
+
+    location = blob_redirect_cache.get(key)
+    if location is None:
+        try:
+            location = await supabase_io.run(blob_store.signed_url, key, BLOB_SIGNED_URL_TTL_S)
+        except Exception:
+            print(traceback.format_exc())
+            raise HTTPException(status_code=404, detail="Blob not found.")
+        blob_redirect_cache.set(key, location)
+    return RedirectResponse(location, status_code=307, headers={"Cache-Control": f"private, max-age={BLOB_SIGNED_URL_TTL_S // 2}"})
+
 # ==============================================================================
 # 13. Root Endpoint
 # ==============================================================================
 @app.get("/", tags=["Root"])
 def read_root():
     """Root endpoint for health checks."""
-    return {"message": "DermaSense AI Backend is running."}
\ No newline at end of file
+    return {"message": "DermaSense AI Backend is running."}
+
+@app.get("/ready", tags=["Root"])
+def readiness_check():
+    """Readiness probe: only succeeds once models are loaded and warmed up."""
+    if not readiness["models_ready"]:
+        raise HTTPException(status_code=503, detail="Models are still loading.")
+    return {"status": "ready"}
+
+@app.get("/metrics/inference", tags=["Root"])
+def inference_metrics():
+    """Exposes inference queue depth and wait times for autoscaling."""
+    return {**inference_executor.stats(), "render": render_executor.stats(), "analysis_cache": analysis_cache.memory.stats(), "case_cache": case_cache.stats(),
+            "tts": tts_cache.stats()}
\ No newline at end of file
@@ -0,0 +1,173 @@
+import os
+from dataclasses import dataclass, fields, replace
+
+import numpy as np
+import cv2
+
+from image_ingest import ImageContext
+
+
+@dataclass(frozen=True)
+class QualityThresholds:
+    """
+    Acceptance limits for the pre-inference quality gate.
+
+    Attributes:
+        min_sharpness (float): Minimum Laplacian variance on the sharpness crop.
+        min_brightness (float): Minimum mean gray level (0-255).
+        max_brightness (float): Maximum mean gray level (0-255).
+        max_clipped_fraction (float): Maximum share of pixels crushed to black or blown to white.
+        max_glare_fraction (float): Maximum share of bright, desaturated (specular) pixels.
+        min_lesion_coverage (float): Minimum share of the frame covered by the central lesion.
+        max_lesion_coverage (float): Maximum share of the frame covered by the central lesion.
+        reject_on_lesion_coverage (bool): Whether the two coverage limits reject the image. Off by
+            default: coverage is reported as a metric only, since healthy skin, eczema or
+            psoriasis often have no distinct dark spot and are still valid model inputs.
+        frame_max_edge (int): Longest edge of the downsampled frame the other stats are computed on.
+        sharpness_crop (int): Edge of the centered crop, at no less than half the native
+            resolution, that sharpness is measured on. Blur is measured near pixel scale so a
+            2-3 px defocus on a 12 MP photo is not hidden by downsampling the whole frame.
+    """
+    min_sharpness: float = 50.0
+    min_brightness: float = 40.0
+    max_brightness: float = 220.0
+    max_clipped_fraction: float = 0.25
+    max_glare_fraction: float = 0.08
+    min_lesion_coverage: float = 0.005
+    max_lesion_coverage: float = 0.95
+    reject_on_lesion_coverage: bool = False
+    frame_max_edge: int = 512
+    sharpness_crop: int = 512
+
+    @classmethod
+    def from_env(cls, mode: str, defaults: "QualityThresholds") -> "QualityThresholds":
+        """Applies QUALITY_<MODE>_<FIELD> environment overrides, e.g. QUALITY_CLINICAL_MIN_SHARPNESS."""
+        overrides = {}
+        for field in fields(cls):
+            value = os.getenv(f"QUALITY_{mode.upper()}_{field.name.upper()}")
+            if value is None:
+                continue
+            if field.type is bool:
+                overrides[field.name] = value.strip().lower() in ("1", "true", "yes", "on")
+            else:
+                overrides[field.name] = field.type(value)
+        return replace(defaults, **overrides)
+
+
+DEFAULT_THRESHOLDS = {
+    # Phone photos: wide framing, uneven lighting.
+    "consumer": QualityThresholds(),
+    # Dermoscopic images: the lesion fills much of the frame and lighting is controlled.
+    "clinical": QualityThresholds(min_sharpness=60.0, max_glare_fraction=0.05, min_lesion_coverage=0.02, max_lesion_coverage=0.98),
+}
+
+# Minimum gray-level gap below the local skin tone for a pixel to count as lesion.
+_MIN_LESION_CONTRAST = 15.0
+# Longest edge of the frame the lesion estimate works on, and the share of each edge
+# treated as surrounding skin.
+_LESION_FRAME_EDGE = 128
+_SKIN_BORDER_FRACTION = 0.1
+
+
+def estimate_lesion_coverage(gray: np.ndarray) -> float:
+    """
+    Estimates the share of the frame covered by the lesion nearest the center.
+
+    The skin tone is modelled as a plane fitted to the outer border band, so even shading
+    across a phone photo is not mistaken for a lesion. Pixels clearly darker than that
+    plane are grouped into connected regions, and the largest region reaching the central
+    half of the frame is taken as the lesion (holes filled). Returns 0.0 when there is no
+    such region, e.g. for even, healthy skin or a lesion that extends past the border band.
+    """
+    height, width = gray.shape
+    scale = _LESION_FRAME_EDGE / max(height, width)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    small = cv2.GaussianBlur(cv2.resize(gray, size, interpolation=cv2.INTER_AREA), (5, 5), 0).astype(np.float32)
+    rows, cols = small.shape
+
+    band_y, band_x = max(1, int(rows * _SKIN_BORDER_FRACTION)), max(1, int(cols * _SKIN_BORDER_FRACTION))
+    border = np.ones((rows, cols), dtype=bool)
+    border[band_y:rows - band_y, band_x:cols - band_x] = False
+    ys, xs = np.mgrid[:rows, :cols].astype(np.float32)
+    design = np.stack([xs[border], ys[border], np.ones(np.count_nonzero(border), np.float32)], axis=1)
+    (slope_x, slope_y, offset), *_ = np.linalg.lstsq(design, small[border], rcond=None)
+    skin = xs * slope_x + ys * slope_y + offset
+
+    mask = (skin - small >= _MIN_LESION_CONTRAST).astype(np.uint8)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    central = np.unique(labels[rows // 4:rows - rows // 4, cols // 4:cols - cols // 4])
+    central = central[central != 0]
+    if central.size == 0:
+        return 0.0
+
+    lesion = central[np.argmax(stats[central, cv2.CC_STAT_AREA])]
+    contours, _ = cv2.findContours((labels == lesion).astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    filled = np.zeros_like(mask)
+    cv2.drawContours(filled, contours, -1, 1, thickness=cv2.FILLED)
+    return float(np.count_nonzero(filled) / filled.size)
+
+
+def assess_quality(image: ImageContext, thresholds: QualityThresholds) -> dict:
+    """
+    Computes exposure/clipping, glare and lesion-coverage stats on a downsampled frame and
+    sharpness on a centered near-native crop, and checks them against `thresholds`. Lesion coverage only rejects when
+    `thresholds.reject_on_lesion_coverage` is set.
+
+    Returns:
+        dict: {"is_clear": bool, "issues": [codes], "metrics": {...}} plus a user-facing
+        "message" when the image is rejected.
+    """
+    frame = image.downscaled(thresholds.frame_max_edge)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    pixel_count = gray.size
+
+    # Sharpness: variance of the Laplacian (16-bit is exact for 8-bit input and cheaper than float64).
+    sharpness = float(cv2.Laplacian(image.detail_gray(thresholds.sharpness_crop), cv2.CV_16S).var())
+
+    # Exposure and clipping from one 256-bin histogram.
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    brightness = float(histogram @ np.arange(256) / pixel_count)
+    clipped_dark = float(histogram[:6].sum() / pixel_count)
+    clipped_bright = float(histogram[250:].sum() / pixel_count)
+
+    # Glare: specular highlights are very bright and nearly colorless.
+    glare = float(np.count_nonzero((hsv[..., 2] >= 240) & (hsv[..., 1] <= 30)) / pixel_count)
+
+    coverage = estimate_lesion_coverage(gray)
+
+    metrics = {
+        "sharpness": round(sharpness, 2),
+        "brightness": round(brightness, 2),
+        "clipped_dark_fraction": round(clipped_dark, 4),
+        "clipped_bright_fraction": round(clipped_bright, 4),
+        "glare_fraction": round(glare, 4),
+        "lesion_coverage": round(coverage, 4),
+    }
+
+    checks = [
+        (sharpness < thresholds.min_sharpness, "blurry",
+         f"Image may be too blurry (Score: {sharpness:.2f}). Please retake with better focus."),
+        (brightness < thresholds.min_brightness, "too_dark",
+         "Image is too dark. Please retake in better lighting."),
+        (brightness > thresholds.max_brightness, "too_bright",
+         "Image is overexposed. Please avoid direct light or flash."),
+        (max(clipped_dark, clipped_bright) > thresholds.max_clipped_fraction, "clipped",
+         "Large parts of the image are fully black or white. Please adjust the lighting."),
+        (glare > thresholds.max_glare_fraction, "glare",
+         "Strong glare detected. Please change the angle to avoid reflections."),
+    ]
+    if thresholds.reject_on_lesion_coverage:
+        checks += [
+            (coverage < thresholds.min_lesion_coverage, "no_lesion",
+             "No distinct lesion found. Please center the spot in the frame and move closer."),
+            (coverage > thresholds.max_lesion_coverage, "too_close",
+             "The lesion fills the whole frame. Please move slightly further away."),
+        ]
+    failed = [(code, message) for is_failed, code, message in checks if is_failed]
+
+    result = {"is_clear": not failed, "issues": [code for code, _ in failed], "metrics": metrics}
+    if failed:
+        result["message"] = " ".join(message for _, message in failed)
+    return result
@@ -0,0 +1,42 @@
+from typing import Optional
+
+import numpy as np
+
+from image_ingest import ImageContext
+from x_ai import apply_heatmap_overlay, encode_image, decode_cam
+
+# Longest edge, in pixels, of each pre-generated rendition.
+RENDITION_SIZES = {"small": 128, "medium": 512}
+
+
+def _encode_renditions(image: ImageContext, quality: int) -> dict:
+    return {
+        name: encode_image(image.downscaled(max_edge), fmt="webp", quality=quality)[0]
+        for name, max_edge in RENDITION_SIZES.items()
+    }
+
+
+def build_renditions(image_bytes: bytes, heatmap_cam: Optional[dict] = None,
+                     heatmap_bytes: Optional[bytes] = None, quality: int = 80) -> dict:
+    """
+    Generates small/medium WebP renditions of a case image and of its heatmap overlay.
+
+    The original is decoded once (at a reduced JPEG scale when large enough). The heatmap
+    comes from the raw CAM when one is stored, rendered straight at the largest rendition
+    size, or else from a pre-rendered heatmap image.
+
+    Returns:
+        dict: {"image": {"small": bytes, "medium": bytes}, "heatmap": {...}}; "heatmap"
+        is omitted when neither a CAM nor a heatmap image is given.
+    """
+    largest = max(RENDITION_SIZES.values())
+    image = ImageContext.from_bytes(image_bytes, min_size=(largest, largest))
+    renditions = {"image": _encode_renditions(image, quality)}
+
+    if heatmap_cam is not None:
+        overlay = apply_heatmap_overlay(image.downscaled(largest), decode_cam(heatmap_cam), max_edge=largest)
+        renditions["heatmap"] = _encode_renditions(ImageContext(b"", np.ascontiguousarray(overlay)), quality)
+    elif heatmap_bytes:
+        heatmap = ImageContext.from_bytes(heatmap_bytes, min_size=(largest, largest))
+        renditions["heatmap"] = _encode_renditions(heatmap, quality)
+    return renditions
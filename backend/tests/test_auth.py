@@ -0,0 +1,104 @@
+import base64
+import json
+import time
+
+import jwt
+import pytest
+from jwt import PyJWKClientError
+
+from auth import AuthenticatedUser, TokenVerifier, token_cache_ttl
+
+SECRET = "test-jwt-secret-with-enough-entropy-for-hs256"
+SUPABASE_URL = "https://project.supabase.co"
+
+
+def make_token(key=SECRET, algorithm="HS256", headers=None, **overrides):
+    claims = {"sub": "user-1", "email": "patient@example.com", "role": "authenticated",
+              "aud": "authenticated", "exp": int(time.time()) + 3600}
+    claims.update(overrides)
+    return jwt.encode(claims, key, algorithm=algorithm, headers=headers)
+
+
+def b64url(data: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+
+
+def test_valid_hs256_token_returns_user():
+    user = TokenVerifier(jwt_secret=SECRET).verify(make_token())
+
+    assert isinstance(user, AuthenticatedUser)
+    assert user.id == "user-1"
+    assert user.email == "patient@example.com"
+    assert user.user_metadata == {}
+
+
+def test_expired_token_is_rejected():
+    verifier = TokenVerifier(jwt_secret=SECRET, leeway=0)
+
+    with pytest.raises(jwt.ExpiredSignatureError):
+        verifier.verify(make_token(exp=int(time.time()) - 60))
+
+
+def test_expiry_within_leeway_is_accepted():
+    verifier = TokenVerifier(jwt_secret=SECRET, leeway=30)
+
+    assert verifier.verify(make_token(exp=int(time.time()) - 5)) is not None
+
+
+def test_wrong_audience_is_rejected():
+    with pytest.raises(jwt.InvalidAudienceError):
+        TokenVerifier(jwt_secret=SECRET).verify(make_token(aud="anon"))
+
+
+def test_wrong_key_is_rejected():
+    token = make_token(key="some-other-secret-with-enough-entropy-too")
+
+    with pytest.raises(jwt.InvalidSignatureError):
+        TokenVerifier(jwt_secret=SECRET).verify(token)
+
+
+def test_missing_subject_is_rejected():
+    token = jwt.encode({"aud": "authenticated", "exp": int(time.time()) + 3600}, SECRET, algorithm="HS256")
+
+    with pytest.raises(jwt.MissingRequiredClaimError):
+        TokenVerifier(jwt_secret=SECRET).verify(token)
+
+
+def test_alg_none_is_never_accepted():
+    token = make_token(key=None, algorithm="none")
+
+    assert TokenVerifier(jwt_secret=SECRET).verify(token) is None
+    assert TokenVerifier(supabase_url=SUPABASE_URL, jwt_secret=SECRET).verify(token) is None
+
+
+def test_hs256_without_secret_defers_to_remote_check():
+    assert TokenVerifier(supabase_url=SUPABASE_URL).verify(make_token()) is None
+
+
+def test_unknown_kid_defers_to_remote_check(monkeypatch):
+    verifier = TokenVerifier(supabase_url=SUPABASE_URL, jwt_secret=SECRET)
+
+    def unknown_key(token):
+        raise PyJWKClientError('Unable to find a signing key that matches: "unknown"')
+
+    monkeypatch.setattr(verifier._jwks, "get_signing_key_from_jwt", unknown_key)
+    header = {"alg": "RS256", "typ": "JWT", "kid": "unknown"}
+    claims = {"sub": "user-1", "aud": "authenticated", "exp": int(time.time()) + 3600}
+    token = f"{b64url(header)}.{b64url(claims)}.c2lnbmF0dXJl"
+
+    assert verifier.verify(token) is None
+
+
+def test_cache_ttl_is_capped_at_token_expiry():
+    ttl = token_cache_ttl(make_token(exp=int(time.time()) + 60), max_ttl=300)
+
+    assert 0 < ttl <= 60
+
+
+def test_cache_ttl_uses_max_ttl_for_long_lived_tokens():
+    assert token_cache_ttl(make_token(exp=int(time.time()) + 3600), max_ttl=300) == 300
+
+
+def test_cache_ttl_is_zero_for_expired_or_malformed_tokens():
+    assert token_cache_ttl(make_token(exp=int(time.time()) - 60), max_ttl=300) == 0.0
+    assert token_cache_ttl("not-a-jwt", max_ttl=300) == 0.0
@@ -0,0 +1,46 @@
+import asyncio
+import os
+from urllib.parse import urlsplit
+
+import pytest
+
+# main.py loads the full serving stack at import time; skip where it isn't installed.
+pytest.importorskip("tensorflow")
+pytest.importorskip("google.generativeai")
+pytest.importorskip("elevenlabs")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("ELEVENLABS_API_KEY", "test")
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+from fastapi import Request  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from blob_store import LocalBlobStore  # noqa: E402
+
+
+@pytest.fixture
+def heatmap_url(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "blob_store", LocalBlobStore(str(tmp_path)))
+    main.heatmap_store.clear()
+    upload = cv2.imencode(".jpg", np.full((64, 64, 3), 128, np.uint8))[1].tobytes()
+    request = Request({"type": "http", "scheme": "http", "server": ("testserver", 80), "path": "/", "headers": []})
+    image_url = asyncio.run(main.store_blob(upload, "image/jpeg"))
+    fields = asyncio.run(main.create_heatmap_handle(request, image_url, "consumer", np.eye(7, dtype=np.float32)))
+    url = urlsplit(fields["heatmapUrl"])
+    return f"{url.path}?{url.query}"
+
+
+def test_deferred_heatmap_renders_from_the_signed_url_alone(heatmap_url):
+    response = TestClient(main.app).get(heatmap_url)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == main.HEATMAP_MIME
+    assert response.content
+
+
+def test_deferred_heatmap_rejects_a_tampered_url(heatmap_url):
+    response = TestClient(main.app).get(heatmap_url.replace("mode=consumer", "mode=clinical"))
+
+    assert response.status_code == 403
@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+# main.py loads the full serving stack at import time; skip where it isn't installed.
+pytest.importorskip("tensorflow")
+pytest.importorskip("google.generativeai")
+pytest.importorskip("elevenlabs")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("ELEVENLABS_API_KEY", "test")
+
+from fastapi import Request  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+
+
+class FakeQuery:
+    """Chainable stand-in for a supabase-py query builder."""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+
+class FakeUser:
+    id = "patient-1"
+
+
+ANALYSIS_RESULT = {
+    "prediction": {
+        "top1": {"label": "Benign keratosis", "confidence": 71.2},
+        "top2": {"label": "Melanocytic nevus", "confidence": 20.1},
+        "riskLevel": "low",
+    },
+    "predictions": [],
+    "explanation": {"explanation_text": "Looks benign.", "recommendation": "Monitor it."},
+    "heatmapImage": None,
+    "heatmapCam": {"shape": [7, 7], "data": ""},
+    "originalImageBase64": "aW1hZ2U=",
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    calls = {"analysis": [], "submitted": []}
+
+    async def fake_stages(request, contents, mode, **options):
+        calls["analysis"].append((request, contents, mode, options))
+        yield "result", dict(ANALYSIS_RESULT)
+
+    async def fake_execute(query):
+        return ("data", [{"id": 7}]), ("count", None)
+
+    async def fake_submit(submit_request, current_user):
+        calls["submitted"].append(submit_request)
+        return {"status": "success", "caseId": 42}
+
+    async def fake_refresh(lesion_id, patient_id):
+        return None
+
+    monkeypatch.setattr(main, "supabase", type("FakeSupabase", (), {"table": lambda self, name: FakeQuery()})())
+    monkeypatch.setattr(main.supabase_io, "execute", fake_execute)
+    monkeypatch.setattr(main, "run_analysis_stages", fake_stages)
+    monkeypatch.setattr(main, "submit_case_for_review", fake_submit)
+    monkeypatch.setattr(main, "refresh_lesion_comparison", fake_refresh)
+    main.app.dependency_overrides[main.get_current_user] = lambda: FakeUser()
+    try:
+        yield TestClient(main.app), calls
+    finally:
+        main.app.dependency_overrides.pop(main.get_current_user, None)
+
+
+def test_add_scan_to_lesion_analyzes_upload_and_saves_private_scan(client):
+    test_client, calls = client
+
+    response = test_client.post("/api/lesions/7/scans", files={"image": ("scan.jpg", b"jpeg-bytes", "image/jpeg")})
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "success", "caseId": 42}
+
+    (request, contents, mode, options), = calls["analysis"]
+    assert isinstance(request, Request)
+    assert contents == b"jpeg-bytes"
+    assert mode == "consumer"
+    assert options == {}
+
+    submitted, = calls["submitted"]
+    assert submitted.lesion_id == 7
+    assert submitted.is_private is True
+    assert submitted.heatmap_cam == ANALYSIS_RESULT["heatmapCam"]
+    assert [p["label"] for p in submitted.predictions] == ["Benign keratosis", "Melanocytic nevus"]
@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterable, Optional
+
+from cache import DiskCache, LRUCache
+
+_AUDIO_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class _Synthesis:
+    """One in-flight synthesis: chunks seen so far, fanned out to any number of listeners."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def append(self, chunk: bytes):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done, self.error = True, error
+        self._notify()
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """Yields every chunk from the start, then new ones as they arrive."""
+        index = 0
+        while True:
+            if index < len(self.chunks):
+                index += 1
+                yield self.chunks[index - 1]
+                continue
+            if self.error is not None:
+                raise self.error
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+class TTSAudioCache:
+    """
+    Persistent text-to-speech audio cache keyed by (sha256(text), voice_id, model_id).
+
+    Hits are files on disk, so they can be served with range requests and ETags. On a
+    miss, `synthesize` pulls the vendor's blocking audio stream on a dedicated thread
+    pool and tees each chunk to the cache file and to every listener. The synthesis runs
+    as its own task, so it finishes (and is cached) even if the first client disconnects,
+    and concurrent requests for the same audio join it instead of paying twice.
+
+    `prefetch` starts speculative syntheses for audio a client is likely to request
+    next, capped at `max_prefetch` at a time so they never take every worker. Finished
+    prefetches are also kept in `memory`, a short-lived store independent of the disk.
+
+    Without a `disk`, requested audio is not persisted: misses still stream and
+    concurrent requests still share one synthesis, but replays synthesize again.
+
+    Parameters:
+        disk (DiskCache, optional): Where finished audio files live.
+        memory (LRUCache, optional): Short-lived store for finished prefetched audio.
+        max_workers (int): Threads available for concurrent syntheses.
+        max_prefetch (int): Maximum speculative syntheses running at once.
+    """
+
+    def __init__(self, disk: Optional[DiskCache], memory: Optional[LRUCache] = None,
+                 max_workers: int = 4, max_prefetch: int = 1):
+        self.disk = disk
+        self.memory = memory
+        # A prefetch needs somewhere to keep its result.
+        can_prefetch = disk is not None or memory is not None
+        self.max_prefetch = max(0, min(int(max_prefetch), int(max_workers) - 1)) if can_prefetch else 0
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="tts")
+        self._in_flight = {}  # key -> _Synthesis
+        self._tasks = set()
+        self._prefetching = 0
+        self.prefetch_started = 0
+        self.prefetch_skipped = 0
+
+    @staticmethod
+    def key(text: str, voice_id: str, model_id: str) -> str:
+        return f"tts:{hashlib.sha256(text.encode('utf-8')).hexdigest()}:{voice_id}:{model_id}"
+
+    @staticmethod
+    def audio_id(key: str) -> str:
+        """Opaque, URL-safe id of a cache entry (its file name on disk)."""
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def path_for_audio_id(self, audio_id: str) -> Optional[str]:
+        if self.disk is None or not _AUDIO_ID_PATTERN.match(audio_id):
+            return None
+        path = os.path.join(self.disk.directory, audio_id)
+        return path if os.path.exists(path) else None
+
+    def cached_path(self, key: str) -> Optional[str]:
+        return self.disk.fresh_path(key) if self.disk is not None else None
+
+    def prefetched_audio(self, key: str) -> Optional[bytes]:
+        """Finished prefetched audio still held in memory, if any."""
+        return self.memory.get(key) if self.memory is not None else None
+
+    def in_flight(self, key: Optional[str] = None, audio_id: Optional[str] = None) -> Optional[_Synthesis]:
+        if audio_id is not None:
+            return next((s for k, s in self._in_flight.items() if self.audio_id(k) == audio_id), None)
+        return self._in_flight.get(key)
+
+    def is_busy(self, key: str) -> bool:
+        return key in self._in_flight or self.cached_path(key) is not None or self.prefetched_audio(key) is not None
+
+    def synthesize(self, key: str, make_stream: Callable[[], Iterable[bytes]],
+                   on_done: Optional[Callable[[], None]] = None, keep_in_memory: bool = False) -> _Synthesis:
+        """Starts synthesizing `key` (or joins the running synthesis) and returns its handle."""
+        synthesis = self._in_flight.get(key)
+        if synthesis is None:
+            synthesis = _Synthesis()
+            self._in_flight[key] = synthesis
+            task = asyncio.get_running_loop().create_task(self._run(key, make_stream, synthesis, keep_in_memory))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            if on_done is not None:
+                task.add_done_callback(lambda _: on_done())
+        return synthesis
+
+    def prefetch(self, key: str, make_stream: Callable[[], Iterable[bytes]]) -> bool:
+        """
+        Speculatively synthesizes `key` into the cache. Skipped (returns False) when the
+        audio is already cached or running, or when all prefetch slots are taken.
+        """
+        if self.is_busy(key):
+            return False
+        if self._prefetching >= self.max_prefetch:
+            self.prefetch_skipped += 1
+            return False
+        self._prefetching += 1
+        self.prefetch_started += 1
+
+        def release():
+            self._prefetching -= 1
+
+        self.synthesize(key, make_stream, on_done=release, keep_in_memory=True)
+        return True
+
+    async def _run(self, key: str, make_stream: Callable[[], Iterable[bytes]], synthesis: _Synthesis,
+                   keep_in_memory: bool = False):
+        loop = asyncio.get_running_loop()
+        writer = self.disk.open_writer(key) if self.disk is not None else None
+        try:
+            iterator = await loop.run_in_executor(self._pool, lambda: iter(make_stream()))
+
+            def pull():
+                chunk = next(iterator, None)
+                if chunk and writer is not None:
+                    writer.write(chunk)
+                return chunk
+
+            while (chunk := await loop.run_in_executor(self._pool, pull)) is not None:
+                if chunk:
+                    synthesis.append(chunk)
+            if writer is not None:
+                await loop.run_in_executor(self._pool, writer.commit)
+            if keep_in_memory and self.memory is not None:
+                self.memory.set(key, b"".join(synthesis.chunks))
+            synthesis.finish()
+        except BaseException as e:
+            if writer is not None:
+                writer.abort()
+            synthesis.finish(e)
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            self._in_flight.pop(key, None)
+
+    def stats(self) -> dict:
+        memory = self.memory.stats() if self.memory is not None else None
+        return {"in_flight": len(self._in_flight), "prefetched_in_memory": memory, "prefetching": self._prefetching, "max_prefetch": self.max_prefetch,
+                "prefetch_started": self.prefetch_started, "prefetch_skipped": self.prefetch_skipped}
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def etag_for(path: str) -> str:
+    """Strong validator for a cached audio file: changes whenever the file is rewritten."""
+    stat = os.stat(path)
+    return '"' + hashlib.sha256(f"{os.path.basename(path)}:{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
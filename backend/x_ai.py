@@ -1,8 +1,133 @@
+import base64
+
 import numpy as np
 import tensorflow as tf
 import cv2
 
-def generate_gradcam(img_array, model, last_conv_layer_name, class_index=None):
+def build_gradcam_model(model, last_conv_layer_name):
+    """
+    Builds a model that maps the input to the last conv activations and the final prediction.
+
+    Build this once per loaded model and reuse it; constructing it on every call
+    re-creates the graph and slowly grows memory in long-running workers.
+
+    Parameters:
+        model (tf.keras.Model): The trained model.
+        last_conv_layer_name (str): Name of the final convolutional layer in the model.
+
+    Returns:
+        tf.keras.Model: Model with outputs [conv_outputs, predictions].
+    """
+    return tf.keras.models.Model(
+        [model.inputs],
+        [model.get_layer(last_conv_layer_name).output, model.output]
+    )
+
+
+def _heatmaps_from_gradients(conv_outputs, grads):
+    """
+    Turns conv activations and their gradients (..., H, W, C) into normalized CAMs (..., H, W).
+    Leading axes broadcast, so one set of activations can be weighted by several classes' gradients.
+    """
+    # Global average pooling: importance of each feature map channel, per image (and class)
+    pooled_grads = tf.reduce_mean(grads, axis=(-3, -2), keepdims=True)
+
+    # Weight the feature maps by the pooled gradients
+    heatmaps = tf.reduce_sum(conv_outputs * pooled_grads, axis=-1)
+
+    # ReLU & Normalize each map to [0, 1]
+    heatmaps = tf.maximum(heatmaps, 0)
+    return heatmaps / (tf.reduce_max(heatmaps, axis=(-2, -1), keepdims=True) + tf.keras.backend.epsilon())
+
+
+def _gradcam_forward(grad_model, img_batch, top_k=1):
+    """Taped forward pass returning (predictions (N, C), heatmaps (N, top_k, h, w)) as tensors."""
+    with tf.GradientTape() as tape:
+        conv_outputs, predictions = grad_model(img_batch, training=False)
+        class_indices = tf.math.top_k(predictions, k=top_k).indices
+        class_outputs = tf.gather(predictions, class_indices, axis=1, batch_dims=1)  # (N, top_k)
+
+    if top_k == 1:
+        # Images in a batch don't interact, so the gradient of the summed scores
+        # gives every row exactly its own gradients.
+        grads = tape.gradient(class_outputs, conv_outputs)[:, tf.newaxis]
+    else:
+        # One vectorized Jacobian over the shared forward pass: each of the k class scores
+        # is only back-propagated through the classifier head, not the whole network.
+        grads = tape.batch_jacobian(class_outputs, conv_outputs)  # (N, top_k, h, w, C)
+    return predictions, _heatmaps_from_gradients(conv_outputs[:, tf.newaxis], grads)
+
+
+def predict_with_gradcam_topk(grad_model, img_batch, top_k=1):
+    """
+    Computes class probabilities and a Grad-CAM for each of the top-k classes.
+
+    All k maps come from a single forward pass and one batched Jacobian, so the cost
+    grows much more slowly than running Grad-CAM k times.
+
+    Parameters:
+        grad_model (tf.keras.Model): Model returned by `build_gradcam_model`.
+        img_batch (np.ndarray): Preprocessed images of shape (N, H, W, 3).
+        top_k (int): Number of top classes to produce a Grad-CAM for.
+
+    Returns:
+        tuple: (predictions of shape (N, num_classes), heatmaps of shape (N, top_k, h, w)),
+        with heatmaps ordered by descending class probability.
+    """
+    predictions, heatmaps = _gradcam_forward(grad_model, img_batch, top_k=top_k)
+    return predictions.numpy(), heatmaps.numpy()
+
+
+def _padded_batch_size(n):
+    """Rounds a batch size up to a power of two so XLA only ever sees a few shapes."""
+    size = 1
+    while size < n:
+        size *= 2
+    return size
+
+
+def make_gradcam_predictor(grad_model, input_shape, compiled=True, jit_compile=False, top_k=1):
+    """
+    Returns a callable with the same contract as `predict_with_gradcam_topk`, optionally backed
+    by a `tf.function` traced against a fixed input signature.
+
+    Parameters:
+        grad_model (tf.keras.Model): Model returned by `build_gradcam_model`.
+        input_shape (tuple): Per-image input shape, e.g. (300, 300, 3).
+        compiled (bool): Wrap the forward pass in `tf.function` to skip eager dispatch.
+        jit_compile (bool): Additionally compile with XLA. Batches are padded to a power of
+            two because XLA specializes on concrete shapes.
+        top_k (int): Number of top classes to produce a Grad-CAM for.
+
+    Returns:
+        Callable: fn(img_batch) -> (predictions (N, C), heatmaps (N, top_k, h, w)) as numpy arrays.
+    """
+    if not compiled:
+        return lambda img_batch: predict_with_gradcam_topk(grad_model, img_batch, top_k=top_k)
+
+    signature = [tf.TensorSpec(shape=(None, *input_shape), dtype=tf.float32)]
+    forward = tf.function(lambda img_batch: _gradcam_forward(grad_model, img_batch, top_k=top_k),
+                          input_signature=signature, jit_compile=jit_compile)
+
+    def predict(img_batch):
+        img_batch = np.asarray(img_batch, dtype=np.float32)
+        n = img_batch.shape[0]
+        if jit_compile and _padded_batch_size(n) != n:
+            padding = np.zeros((_padded_batch_size(n) - n, *img_batch.shape[1:]), dtype=np.float32)
+            img_batch = np.concatenate([img_batch, padding])
+        predictions, heatmaps = forward(img_batch)
+        return predictions.numpy()[:n], heatmaps.numpy()[:n]
+
+    return predict
+
+
+def warmup_predictor(predictor, input_shape, batch_sizes=(1,)):
+    """Runs dummy batches through a predictor so tracing/compilation happens before traffic arrives."""
+    for batch_size in batch_sizes:
+        predictor(np.zeros((batch_size, *input_shape), dtype=np.float32))
+
+
+def generate_gradcam(img_array, model, last_conv_layer_name, class_index=None, grad_model=None):
     """
     Generates a Grad-CAM heatmap for a given input image and model.
     
@@ -11,15 +136,13 @@ def generate_gradcam(img_array, model, last_conv_layer_name, class_index=None):
         model (tf.keras.Model): The trained model.
         last_conv_layer_name (str): Name of the final convolutional layer in the model.
         class_index (int, optional): Target class index. If None, uses top predicted class.
+        grad_model (tf.keras.Model, optional): Prebuilt model from `build_gradcam_model`.
     
     Returns:
         np.ndarray: 2D normalized heatmap of shape (H, W) in range [0, 1].
     """
-    # Build a model that maps input to the activations and final prediction
-    grad_model = tf.keras.models.Model(
-        [model.inputs],
-        [model.get_layer(last_conv_layer_name).output, model.output]
-    )
+    if grad_model is None:
+        grad_model = build_gradcam_model(model, last_conv_layer_name)
 
     # Record operations for automatic differentiation
     with tf.GradientTape() as tape:
@@ -31,20 +154,42 @@ def generate_gradcam(img_array, model, last_conv_layer_name, class_index=None):
     # Compute the gradients of the class output w.r.t. conv layer output
     grads = tape.gradient(class_output, conv_outputs)
 
-    # Global average pooling: importance of each feature map channel
-    pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
+    return _heatmaps_from_gradients(conv_outputs, grads)[0].numpy()
+
+
+def encode_cam(cam: np.ndarray, dtype="uint8") -> dict:
+    """
+    Packs a raw [0, 1] Grad-CAM into a compact, JSON-friendly form.
+
+    Parameters:
+        cam (np.ndarray): 2D heatmap, typically the size of the last conv feature map.
+        dtype (str): "uint8" (quantized to 0-255) or "float16".
+
+    Returns:
+        dict: {"shape": [h, w], "dtype": dtype, "data": base64 of the raw buffer}.
+    """
+    cam = np.clip(np.asarray(cam, dtype=np.float32), 0, 1)
+    packed = np.round(cam * 255).astype(np.uint8) if dtype == "uint8" else cam.astype(np.float16)
+    return {"shape": list(packed.shape), "dtype": dtype, "data": base64.b64encode(packed.tobytes()).decode("ascii")}
+
+
+def decode_cam(encoded: dict) -> np.ndarray:
+    """Inverse of `encode_cam`; returns a float32 heatmap in [0, 1]."""
+    dtype = np.dtype(encoded.get("dtype", "uint8"))
+    cam = np.frombuffer(base64.b64decode(encoded["data"]), dtype=dtype).reshape(encoded["shape"])
+    return cam.astype(np.float32) / 255.0 if dtype == np.uint8 else cam.astype(np.float32)
 
-    # Weight the feature maps by the pooled gradients
-    conv_outputs = conv_outputs[0]  # shape: (H, W, Channels)
-    heatmap = tf.reduce_sum(conv_outputs * pooled_grads, axis=-1)
 
-    # ReLU & Normalize to [0, 1]
-    heatmap = tf.maximum(heatmap, 0) / (tf.reduce_max(heatmap) + tf.keras.backend.epsilon())
+# JET colormap as a 256-entry BGR lookup table, computed once at import.
+_JET_LUT = cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(256, 1), cv2.COLORMAP_JET).reshape(256, 3)
 
-    return heatmap.numpy()
+_ENCODE_PARAMS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg"),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp"),
+}
 
 
-def apply_heatmap_overlay(original_image: np.ndarray, heatmap: np.ndarray, alpha=0.4) -> np.ndarray:
+def apply_heatmap_overlay(original_image: np.ndarray, heatmap: np.ndarray, alpha=0.4, max_edge=None) -> np.ndarray:
     """
     Overlays a heatmap onto an original image using OpenCV.
 
@@ -52,17 +197,44 @@ def apply_heatmap_overlay(original_image: np.ndarray, heatmap: np.ndarray, alpha
         original_image (np.ndarray): Original image (H, W, 3) in BGR format.
         heatmap (np.ndarray): 2D heatmap in range [0, 1].
         alpha (float): Blending ratio for the heatmap.
+        max_edge (int, optional): Longest edge of the output. Larger originals are
+            downscaled first, so the cost no longer depends on the camera resolution.
 
     Returns:
         np.ndarray: Blended BGR image with heatmap overlay (uint8).
     """
-    # Resize heatmap to match original image size
-    heatmap_resized = cv2.resize(heatmap, (original_image.shape[1], original_image.shape[0]))
+    height, width = original_image.shape[:2]
+    if max_edge and max(height, width) > max_edge:
+        scale = max_edge / max(height, width)
+        width, height = max(1, round(width * scale)), max(1, round(height * scale))
+        original_image = cv2.resize(original_image, (width, height), interpolation=cv2.INTER_AREA)
 
-    # Convert heatmap to color map (Jet) and uint8 format
-    heatmap_colored = cv2.applyColorMap(np.uint8(255 * heatmap_resized), cv2.COLORMAP_JET)
+    # Resize heatmap to match the output size
+    heatmap_resized = cv2.resize(np.asarray(heatmap, dtype=np.float32), (width, height))
+
+    # Convert heatmap to color map (Jet) via the lookup table
+    heatmap_colored = _JET_LUT[np.uint8(255 * np.clip(heatmap_resized, 0, 1))]
 
     # Overlay heatmap onto the original image
     overlay = cv2.addWeighted(original_image, 1 - alpha, heatmap_colored, alpha, 0)
 
     return overlay
+
+
+def encode_image(image: np.ndarray, fmt="jpeg", quality=85):
+    """
+    Encodes a BGR image for transport.
+
+    Parameters:
+        image (np.ndarray): BGR image (H, W, 3), uint8.
+        fmt (str): "jpeg" or "webp".
+        quality (int): Encoder quality, 1-100.
+
+    Returns:
+        tuple: (encoded bytes, MIME type).
+    """
+    extension, quality_flag, mime_type = _ENCODE_PARAMS[fmt]
+    ok, buffer = cv2.imencode(extension, image, [quality_flag, int(quality)])
+    if not ok:
+        raise ValueError(f"Could not encode image as {fmt}.")
+    return buffer.tobytes(), mime_type
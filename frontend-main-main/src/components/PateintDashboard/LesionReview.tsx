@@ -35,31 +35,52 @@ function getStatus(status: string) {
 export default function LesionReview() {
   const [reviews, setReviews] = useState<ProfessionalReviewItem[]>([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
-  useEffect(() => {
-    setLoading(true);
-    fetch("https://dermsense-1067130927657.us-central1.run.app/api/patient/reviews", {
+  const fetchReviewsPage = async (cursor: string | null): Promise<ProfessionalReviewItem[]> => {
+    const url = new URL("https://dermsense-1067130927657.us-central1.run.app/api/patient/reviews");
+    if (cursor) url.searchParams.set("cursor", cursor);
+    const res = await fetch(url.toString(), {
       headers: {
         "Authorization": `Bearer ${getAuthToken() || ""}`,
       },
-    })
-      .then((res) => res.json())
-      .then((data) => {
-        const mapped: ProfessionalReviewItem[] = data.map((item: any) => ({
-          id: item.id,
-          imageUrl: item.image_url,
-          lesionName: (item.predictions && item.predictions[0]?.label) || "Untitled Lesion",
-          top1: item.predictions && item.predictions[0] ? item.predictions[0].label : "Unknown",
-          submittedOn: item.submitted_at,
-          status: getStatus(item.status),
-          doctorNotes: item.doctor_notes || undefined,
-        }));
-        setReviews(mapped);
-        setLoading(false);
-      })
-      .catch(() => setLoading(false));
+    });
+    if (!res.ok) throw new Error("Failed to fetch reviews");
+    setNextCursor(res.headers.get("X-Next-Cursor"));
+    const data = (await res.json()) || [];
+    return data.map((item: any) => ({
+      id: item.id,
+      imageUrl: item.renditions?.image?.small || item.image_url,
+      lesionName: (item.predictions && item.predictions[0]?.label) || "Untitled Lesion",
+      top1: item.predictions && item.predictions[0] ? item.predictions[0].label : "Unknown",
+      submittedOn: item.submitted_at,
+      status: getStatus(item.status),
+      doctorNotes: item.doctor_notes || undefined,
+    }));
+  };
+
+  useEffect(() => {
+    setLoading(true);
+    fetchReviewsPage(null)
+      .then((mapped) => setReviews(mapped))
+      .catch(() => setReviews([]))
+      .finally(() => setLoading(false));
   }, []);
 
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const more = await fetchReviewsPage(nextCursor);
+      setReviews((prev) => [...prev, ...more]);
+    } catch (e) {
+      // Keep what is already shown.
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   return (
     <motion.section
       initial={{ opacity: 0, y: 20 }}
@@ -164,6 +185,19 @@ export default function LesionReview() {
           </AnimatePresence>
         )}
       </div>
+      {!loading && nextCursor && (
+        <div className="flex justify-center mt-8">
+          <button
+            onClick={loadMore}
+            disabled={loadingMore}
+            className="flex items-center bg-blue-600 hover:bg-blue-500 transition text-white px-5 py-2 rounded-full text-sm font-semibold shadow border border-white/20"
+            type="button"
+          >
+            {loadingMore && <Loader className="animate-spin w-4 h-4 mr-2" />}
+            Load more
+          </button>
+        </div>
+      )}
     </motion.section>
   );
 }
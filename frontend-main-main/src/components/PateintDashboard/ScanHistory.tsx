@@ -12,6 +12,8 @@ interface ScanHistoryItem {
   submitted_at: string;
   ai_explanation?: string;
   heatmap_image_url?: string;
+  // Pre-generated WebP renditions (128 px "small", 512 px "medium") for list views.
+  renditions?: { image?: { small?: string; medium?: string }; heatmap?: { small?: string; medium?: string } };
 }
 
 const formatDateTime = (iso: string) => {
@@ -40,18 +42,25 @@ export default function ScanHistory() {
   const [scans, setScans] = useState<ScanHistoryItem[]>([]);
   const [loading, setLoading] = useState(true);
   const [selectedScan, setSelectedScan] = useState<ScanHistoryItem | null>(null);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+
+  const fetchHistoryPage = async (cursor: string | null) => {
+    const url = new URL('https://dermsense-1067130927657.us-central1.run.app/api/patient/scans/history');
+    if (cursor) url.searchParams.set('cursor', cursor);
+    const res = await fetch(url.toString(), {
+      headers: { Authorization: `Bearer ${getAuthToken()}` }
+    });
+    if (!res.ok) throw new Error('Failed to fetch scan history');
+    setNextCursor(res.headers.get('X-Next-Cursor'));
+    return (await res.json()) || [];
+  };
 
   useEffect(() => {
     const fetchHistory = async () => {
       setLoading(true);
       try {
-        const token = getAuthToken();
-        const res = await fetch('https://dermsense-1067130927657.us-central1.run.app/api/patient/scans/history', {
-          headers: { Authorization: `Bearer ${token}` }
-        });
-        if (!res.ok) throw new Error('Failed to fetch scan history');
-        const data = await res.json();
-        setScans(data || []);
+        setScans(await fetchHistoryPage(null));
       } catch (e) {
         setScans([]);
       } finally {
@@ -61,6 +70,34 @@ export default function ScanHistory() {
     fetchHistory();
   }, []);
 
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const more = await fetchHistoryPage(nextCursor);
+      setScans((prev) => [...prev, ...more]);
+    } catch (e) {
+      // Keep what is already shown.
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  // The list omits the explanation, so load the full scan when its details are opened.
+  const openScan = async (scan: ScanHistoryItem) => {
+    setSelectedScan(scan);
+    try {
+      const res = await fetch(`https://dermsense-1067130927657.us-central1.run.app/api/patient/scans/${scan.id}`, {
+        headers: { Authorization: `Bearer ${getAuthToken()}` }
+      });
+      if (!res.ok) return;
+      const full: ScanHistoryItem = await res.json();
+      setSelectedScan((current) => (current && current.id === scan.id ? { ...current, ...full } : current));
+    } catch (e) {
+      // The summary row is still shown.
+    }
+  };
+
   return (
     <>
       <motion.section
@@ -105,7 +142,7 @@ export default function ScanHistory() {
                   <div className="flex-shrink-0 flex flex-col items-center">
                     <div className="w-16 h-16 bg-white/20 rounded-full border-2 border-blue-100/30 shadow flex items-center justify-center overflow-hidden">
                       <img
-                        src={decodeImageUrl(scan.image_url)}
+                        src={decodeImageUrl(scan.renditions?.image?.small || scan.image_url)}
                         alt="Scan thumbnail"
                         className="w-full h-full object-cover rounded-full"
                       />
@@ -128,7 +165,7 @@ export default function ScanHistory() {
                   <button
                     className="ml-6 flex items-center bg-blue-600 hover:bg-blue-400/10 transition text-white-100 px-3 py-1.5 rounded-full text-sm font-semibold shadow border border-white/20 backdrop-blur absolute right-5 bottom-5 opacity-90 group-hover:opacity-100"
                     style={{ fontWeight: 600, letterSpacing: 0.5 }}
-                    onClick={() => setSelectedScan(scan)}
+                    onClick={() => openScan(scan)}
                     type="button"
                   >
                     View Details
@@ -139,6 +176,19 @@ export default function ScanHistory() {
             </AnimatePresence>
           )}
         </div>
+        {!loading && nextCursor && (
+          <div className="flex justify-center mt-8">
+            <button
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="flex items-center bg-blue-600 hover:bg-blue-500 transition text-white px-5 py-2 rounded-full text-sm font-semibold shadow border border-white/20"
+              type="button"
+            >
+              {loadingMore && <Loader className="animate-spin w-4 h-4 mr-2" />}
+              Load more
+            </button>
+          </div>
+        )}
       </motion.section>
 
       {/* === MODAL FOR VIEW DETAILS === */}
@@ -169,7 +219,7 @@ export default function ScanHistory() {
                 <div>
                   <h4 className="text-base font-semibold text-white mb-2">Original Image</h4>
                   <img
-                    src={decodeImageUrl(selectedScan.image_url)}
+                    src={decodeImageUrl(selectedScan.renditions?.image?.medium || selectedScan.image_url)}
                     alt="Original"
                     className="rounded-xl aspect-square object-cover border border-slate-700 w-full"
                   />
@@ -178,7 +228,7 @@ export default function ScanHistory() {
                   <h4 className="text-base font-semibold text-white mb-2">AI Heatmap</h4>
                   {selectedScan.heatmap_image_url ? (
                     <img
-                      src={decodeImageUrl(selectedScan.heatmap_image_url)}
+                      src={decodeImageUrl(selectedScan.renditions?.heatmap?.medium || selectedScan.heatmap_image_url)}
                       alt="Heatmap"
                       className="rounded-xl aspect-square object-cover border border-slate-700 w-full"
                     />
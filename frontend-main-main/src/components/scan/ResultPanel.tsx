@@ -27,6 +27,7 @@ interface ResultPanelProps {
   lesionId?: number | null;
   originalImageBase64?: string;
   heatmapImage?: string;
+  heatmapCam?: Record<string, any> | null;
 }
 
 export default function ResultPanel({
@@ -38,7 +39,8 @@ export default function ResultPanel({
     isLoggedIn,
     lesionId,
     originalImageBase64,
-    heatmapImage
+    heatmapImage,
+    heatmapCam
 }: ResultPanelProps) {
   const [displayedText, setDisplayedText] = useState('');
   const [counterValue, setCounterValue] = useState(0);
@@ -143,7 +145,8 @@ export default function ResultPanel({
     try {
         const payload = {
             image_base64: originalImageBase64 || '',
-            heatmap_image_base64: heatmapImage || '',
+            heatmap_cam: heatmapCam || null,
+            ...(heatmapCam ? {} : { heatmap_image_base64: heatmapImage || '' }),
             predictions: predictions,
             risk_level: riskLevel,
             ai_explanation: explanation.explanation_text || explanation.technical_summary || "N/A",
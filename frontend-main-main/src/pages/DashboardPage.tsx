@@ -26,6 +26,8 @@ interface Case {
   patient_id?: string;
   image_url?: string;
   heatmap_image_url?: string;
+  // Pre-generated WebP renditions (128 px "small", 512 px "medium") for list views.
+  renditions?: { image?: { small?: string; medium?: string }; heatmap?: { small?: string; medium?: string } };
   notes?: string;
 }
 
@@ -58,38 +60,64 @@ const DashboardPage: React.FC = () => {
   const [currentNotes, setCurrentNotes] = useState('');
   const [currentStatus, setCurrentStatus] = useState<Case['status']>('new');
   const [isUpdating, setIsUpdating] = useState<number | null>(null);
+  // Keyset cursor for the next page of cases (null when there are no more).
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState<boolean>(false);
 
   // Modal for viewing images
   const [modal, setModal] = useState<{ open: boolean; url: string; label: string } | null>(null);
 
+  const fetchCasesPage = async (cursor: string | null, status: typeof activeFilter) => {
+    const url = new URL('https://dermsense-1067130927657.us-central1.run.app/api/cases');
+    if (cursor) url.searchParams.set('cursor', cursor);
+    // Status tabs are filtered server-side, so each tab pages through its own matches.
+    if (status !== 'all') url.searchParams.set('status', status);
+    const response = await fetch(url.toString());
+    if (!response.ok) {
+      const errData = await response.json();
+      throw new Error(errData.detail || 'Failed to fetch clinical cases.');
+    }
+    const data: Case[] = await response.json();
+    return { data, cursor: response.headers.get('X-Next-Cursor') };
+  };
+
+  // (Re)load the first page whenever the tab changes; the cursor belongs to the active tab.
   useEffect(() => {
+    let cancelled = false;
     const fetchCases = async () => {
       setIsLoading(true);
       setError(null);
+      setNextCursor(null);
       try {
-        const response = await fetch('https://dermsense-1067130927657.us-central1.run.app/api/cases');
-        if (!response.ok) {
-          const errData = await response.json();
-          throw new Error(errData.detail || 'Failed to fetch clinical cases.');
-        }
-        const data: Case[] = await response.json();
-        setCases(data);
+        const page = await fetchCasesPage(null, activeFilter);
+        if (cancelled) return;
+        setFilteredCases(page.data);
+        setNextCursor(page.cursor);
+        if (activeFilter === 'all') setCases(page.data);
       } catch (err) {
-        setError(err instanceof Error ? err.message : 'An unknown error occurred.');
+        if (!cancelled) setError(err instanceof Error ? err.message : 'An unknown error occurred.');
       } finally {
-        setIsLoading(false);
+        if (!cancelled) setIsLoading(false);
       }
     };
     fetchCases();
-  }, []);
+    return () => { cancelled = true; };
+  }, [activeFilter]);
 
-  useEffect(() => {
-    if (activeFilter === 'all') {
-      setFilteredCases(cases);
-    } else {
-      setFilteredCases(cases.filter(c => c.status === activeFilter));
+  const handleLoadMore = async () => {
+    if (!nextCursor) return;
+    setIsLoadingMore(true);
+    try {
+      const page = await fetchCasesPage(nextCursor, activeFilter);
+      setFilteredCases(prevCases => [...prevCases, ...page.data]);
+      setNextCursor(page.cursor);
+      if (activeFilter === 'all') setCases(prevCases => [...prevCases, ...page.data]);
+    } catch (err) {
+      alert(`Error loading cases: ${err instanceof Error ? err.message : 'Unknown error'}`);
+    } finally {
+      setIsLoadingMore(false);
     }
-  }, [activeFilter, cases]);
+  };
 
   // Status and note editing logic
   const handleCaseClick = (caseItem: Case) => {
@@ -122,6 +150,12 @@ const DashboardPage: React.FC = () => {
       setCases(prevCases =>
         prevCases.map(c => c.id === caseId ? updatedCase : c)
       );
+      // A case whose new status no longer matches the active tab leaves the list.
+      setFilteredCases(prevCases =>
+        prevCases
+          .map(c => c.id === caseId ? updatedCase : c)
+          .filter(c => activeFilter === 'all' || c.status === activeFilter)
+      );
       setExpandedCase(null);
     } catch (err) {
       alert(`Error updating case: ${err instanceof Error ? err.message : 'Unknown error'}`);
@@ -331,7 +365,7 @@ const DashboardPage: React.FC = () => {
                             <td className="px-6 py-4 whitespace-nowrap">
                               <div className="flex items-center">
                                 <div className="flex-shrink-0 h-12 w-12">
-                                  <img className="h-12 w-12 rounded-lg object-cover border border-slate-200 dark:border-slate-700 shadow-sm" src={caseItem.image_url} alt="Case thumbnail" />
+                                  <img className="h-12 w-12 rounded-lg object-cover border border-slate-200 dark:border-slate-700 shadow-sm" src={caseItem.renditions?.image?.small || caseItem.image_url} alt="Case thumbnail" />
                                 </div>
                                 <div className="ml-4">
                                   <div className="text-sm font-medium text-slate-900 dark:text-slate-100">Case #{caseItem.id}</div>
@@ -391,7 +425,7 @@ const DashboardPage: React.FC = () => {
                                       <div>
                                         <h3 className="text-lg font-semibold mb-3">Original Image</h3>
                                         <div className="relative overflow-hidden rounded-lg border border-slate-200 dark:border-slate-700 shadow-md group">
-                                          <img src={caseItem.image_url} alt="Patient skin lesion" className="w-full h-64 object-cover" />
+                                          <img src={caseItem.renditions?.image?.medium || caseItem.image_url} alt="Patient skin lesion" className="w-full h-64 object-cover" />
                                           <div className="absolute inset-0 bg-gradient-to-t from-black/50 to-transparent opacity-0 group-hover:opacity-100 transition-opacity flex items-end justify-center p-4">
                                             <button
                                               className="btn btn-sm btn-primary"
@@ -404,7 +438,7 @@ const DashboardPage: React.FC = () => {
                                       <div>
                                         <h3 className="text-lg font-semibold mb-3">AI Focus Area (Heatmap)</h3>
                                         <div className="relative overflow-hidden rounded-lg border border-slate-200 dark:border-slate-700 shadow-md group">
-                                          <img src={caseItem.heatmap_image_url} alt="AI analysis heatmap" className="w-full h-64 object-cover" />
+                                          <img src={caseItem.renditions?.heatmap?.medium || caseItem.heatmap_image_url} alt="AI analysis heatmap" className="w-full h-64 object-cover" />
                                           <div className="absolute inset-0 bg-gradient-to-t from-black/50 to-transparent opacity-0 group-hover:opacity-100 transition-opacity flex items-end justify-center p-4">
                                             <button
                                               className="btn btn-sm btn-primary"
@@ -465,6 +499,14 @@ const DashboardPage: React.FC = () => {
                   <p className="text-slate-500 dark:text-slate-400">No cases found for the selected filter.</p>
                 </div>
               )}
+              {nextCursor && (
+                <div className="flex justify-center py-4 border-t border-slate-200 dark:border-slate-700">
+                  <button onClick={handleLoadMore} disabled={isLoadingMore} className="btn btn-secondary flex items-center">
+                    {isLoadingMore && <Loader className="h-4 w-4 mr-2 animate-spin" />}
+                    Load more cases
+                  </button>
+                </div>
+              )}
             </div>
           )}
         </motion.div>
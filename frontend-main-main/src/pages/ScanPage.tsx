@@ -21,6 +21,7 @@ export interface AnalysisResult {
   riskLevel: 'low' | 'medium' | 'high' | 'unknown';
   explanation: Explanation;
   heatmapImage: string;
+  heatmapCam?: Record<string, any> | null;
   originalImageBase64: string;
 }
 
@@ -82,6 +83,7 @@ export default function ScanPage() {
         riskLevel: responseData.prediction?.riskLevel,
         explanation: responseData.explanation,
         heatmapImage: responseData.heatmapImage,
+        heatmapCam: responseData.heatmapCam,
         originalImageBase64: responseData.originalImageBase64,
       };
       
@@ -111,13 +113,16 @@ export default function ScanPage() {
 
     setCaseSubmissionStatus('submitting');
     try {
-        const { predictions, riskLevel, explanation, originalImageBase64, heatmapImage } = analysisResult;
+        const { predictions, riskLevel, explanation, originalImageBase64, heatmapImage, heatmapCam } = analysisResult;
         
         // FIX: Add the 'is_private' flag to the payload.
         // It's true if a lesionId exists, ensuring it's treated as a private tracking scan.
         const payload = {
             image_base64: originalImageBase64,
-            heatmap_image_base64: heatmapImage,
+            // Compact raw CAM; the backend renders the overlay on demand, so the rendered
+            // heatmap is only uploaded when no CAM is available.
+            heatmap_cam: heatmapCam || null,
+            ...(heatmapCam ? {} : { heatmap_image_base64: heatmapImage }),
             predictions: predictions,
             risk_level: riskLevel,
             ai_explanation: explanation.explanation_text || explanation.technical_summary || "N/A",
@@ -297,6 +302,7 @@ export default function ScanPage() {
                   lesionId={lesionId}
                   originalImageBase64={analysisResult.originalImageBase64}
                   heatmapImage={analysisResult.heatmapImage}
+                  heatmapCam={analysisResult.heatmapCam}
                 />
               </motion.div>
             )}